@@ -2,9 +2,32 @@
 # 11/16/2016
 """Classes to perform KMeans Clustering"""
 
+import itertools
+import json
 import math
+import os
 import random
+import time
+import threading
+import weakref
+import asyncio
+import multiprocessing
 import numpy
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+# The step engines understood by ClusterGroup
+ENGINES = ('lloyd','hamerly','kdtree','minibatch','approx','hierarchical')
+
+# The ways ClusterGroup can pick its initial centroids
+SEEDINGS = ('random','k-means++','k-means||')
+
+# Roughly how many bytes of points and distances a step handles at a time
+BLOCK_BYTES = 1<<24
+
+# The most steps of each small k-means run that splits a node of a
+# 'hierarchical' cluster tree
+SPLIT_STEPS = 20
 
 # HELPER FUNCTIONS FOR ASSERTS GO HERE
 def is_point(thelist):
@@ -24,10 +47,16 @@ def is_point(thelist):
 def valid_contents(dimension,contents):
     """Return: True if contents is None, or is a 2D list that is nonempty
     and the number of columns of contents is equal to dim.
+
+    A 2D numpy array with at least one row and dim columns is also accepted.
     """
     if(contents is None):
         return True
 
+    if(isinstance(contents,numpy.ndarray)):
+        return contents.ndim==2 and contents.shape[0]>0 and \
+            contents.shape[1]==dimension
+
     if(type(contents)!=list):
         return False
     if(len(contents)<1):
@@ -41,6 +70,33 @@ def valid_contents(dimension,contents):
     return okay
 
 
+def valid_dtype(dtype):
+    """Return: True if dtype names a numpy floating point type (for example
+    numpy.float32 or 'float64').
+    """
+    try:
+        return numpy.dtype(dtype).kind=='f'
+    except TypeError:
+        return False
+
+
+def valid_weights(size,weights):
+    """Return: True if weights is None, or is a list or 1D numpy array of
+    size positive finite numbers.
+    """
+    if(weights is None):
+        return True
+
+    if(type(weights)!=list and not isinstance(weights,numpy.ndarray)):
+        return False
+    try:
+        weights=numpy.asarray(weights,dtype=numpy.float64)
+    except (TypeError,ValueError):
+        return False
+    return weights.shape==(size,) and bool(numpy.all(numpy.isfinite(weights)))\
+        and bool(numpy.all(weights>0))
+
+
 def valid_seed_inds(dataset,k,seed_inds):
     """Return: True if seed_inds is None, or is a list of k valid indices
     into ds.
@@ -53,426 +109,3630 @@ def valid_seed_inds(dataset,k,seed_inds):
     if(len(seed_inds)!=k):
         return False
 
-    okay=False
+    okay=True
     for x in seed_inds:
-        if(dataset.getContents()[x] in dataset.getContents()):
-            okay=True
+        if(type(x)!=int or not 0<=x<dataset.getSize()):
+            okay=False
 
     return okay
 
 
-# CLASSES
-class Dataset(object):
-    """Instance is a dataset for k-means clustering.
+# HELPER FUNCTIONS FOR THE CLUSTERING KERNELS
+def _sq_distances(points, centroids):
+    """Returns: the 2D numpy array of squared euclidean distances from every
+    point to every centroid.
 
-    The data is stored as a list of list of numbers
-    (ints or floats).  Each component list is a data point.
+    Entry [i,j] of the result is the squared distance from points[i] to
+    centroids[j].  The distances are computed as |x|^2 - 2x.c + |c|^2, so the
+    bulk of the work is a single matrix product.  Rounding can make that
+    expression slightly negative for (nearly) equal vectors, so the result
+    is clipped at 0.
 
-    Instance Attributes:
-        _dimension: the point dimension for this dataset
-            [int > 0. Value never changes after initialization]
+    Parameter points: the points to measure from
+    Precondition: points is a 2D numpy array of floats
 
-        _contents: the dataset contents
-            [a 2D list of numbers (float or int), possibly empty]:
+    Parameter centroids: the centroids to measure to
+    Precondition: centroids is a 2D numpy array of floats with the same
+    number of columns as points
+    """
+    psq=numpy.einsum('ij,ij->i',points,points)
+    csq=numpy.einsum('ij,ij->i',centroids,centroids)
+    dist=points @ centroids.T
+    dist*=-2.0
+    dist+=psq[:,None]
+    dist+=csq[None,:]
+    numpy.maximum(dist,0.0,out=dist)
+    return dist
 
-    ADDITIONAL INVARIANT:
-        The number of columns in _contents is equal to _dimension.
-        That is, for every item _contents[i] in the list _contents,
-        len(_contents[i]) == dimension.
 
-    None of the attributes should be accessed directly outside of the class
-    Dataset (e.g. in the methods of class Cluster or KMeans). Instead, this
-    class has getter and setter style methods (with the appropriate
-    preconditions) for modifying these values.
+def _sq_norms(points):
+    """Returns: the 1D numpy array of the squared length of every point.
+
+    Parameter points: the points to measure
+    Precondition: points is a 2D numpy array of floats
     """
+    return numpy.einsum('ij,ij->i',points,points,dtype=numpy.float64)
 
-    def __init__(self, dim, contents=None):
-        """Initializer: Creates a dataset for the given point dimension.
 
-        Note that contents (which is the initial value for
-        attribute _contents) is optional. When assigning contents to the
-        attribute _contents theinitializer COPIES the  list contents. If
-        contents is None, the initializer assigns _contents an empty list.
+def _nearest(points, centroids):
+    """Returns: the 1D numpy array of the index of the nearest centroid to
+    each point.
 
-        Parameter dim: the initial value for attribute _dimension.
-        Precondition: dim is an int > 0.
+    Distances are compared squared, so no square roots are taken.  Ties are
+    broken in favor of the centroid occurring earlier in centroids.
 
-        Parameter contents: the initial value for attribute _contents
-        (optional). Precondition: contents is either None or is a 2D list
-        of numbers (int or float). If contents is not None, then contents
-        if not empty and the number of columns of contents is equal to dim.
-        """
-        assert type(dim)==int and dim > 0
-        assert valid_contents(dim,contents)
+    Parameter points: the points to assign
+    Precondition: points is a 2D numpy array of floats
 
-        self._dim=dim
-        copy=[]
-        if(contents is not None):
-                for x in contents:
-                    copy.append(x)
-        self._contents = copy
+    Parameter centroids: the candidate centroids
+    Precondition: centroids is a nonempty 2D numpy array of floats with the
+    same number of columns as points
+    """
+    return numpy.argmin(_sq_distances(points,centroids),axis=1)
 
 
-    def getDimension(self):
-        """Returns: The point dimension of this data set.
-        """
-        return self._dim
+def _block_distances(points, centroids, norms, cnorms, limit=BLOCK_BYTES,
+        indices=None):
+    """Yields: a pair (start, dist) for each block of points, where dist
+    is the 2D numpy array of squared distances from the points of the block
+    to every centroid.
 
+    The blocks are consecutive runs of points (or of points[indices], if
+    indices is given) starting at position start, small enough that dist
+    takes about limit bytes.  The distances are |x|^2 - 2x.c + |c|^2 with
+    the given squared lengths, clipped at 0, computed in the same order of
+    operations as Dataset._assign, so the nearest centroids agree with it.
 
-    def getSize(self):
-        """Returns: the number of elements in this data set.
-        """
-        return len(self._contents)
+    Parameter points: the points to measure from
+    Precondition: points is a 2D numpy array of floats
 
+    Parameter centroids: the centroids to measure to
+    Precondition: centroids is a nonempty 2D numpy array of floats with
+    the same number of columns as points
 
-    def getContents(self):
-        """Returns: The contents of this data set as a list.
+    Parameter norms: the squared length of every point
+    Precondition: norms is a 1D numpy array of floats, one per row of
+    points
 
-        This method returns the attribute _contents directly.  Any changes
-        made to this list will modify the data set.  If you want to access
-        the data set, but want to protect yourself from modifying the data,
-        use getPoint() instead.
-        """
-        copy = []
-        array = self._contents
-        for r in range(len(array)):
-            copy.append(array[r][:])
-        return copy
+    Parameter cnorms: the squared length of every centroid
+    Precondition: cnorms is a 1D numpy array of floats, one per centroid
 
+    Parameter limit: the number of bytes a block may use (optional)
+    Precondition: limit is an int > 0
 
-    def getPoint(self, i):
-        """Returns: A COPY of the point at index i in this data set.
+    Parameter indices: the points to measure (optional)
+    Precondition: indices is None (all points) or a 1D numpy array of
+    valid row indices of points
+    """
+    n=len(points) if indices is None else len(indices)
+    rows=_block_rows(points.shape[1],len(centroids),limit)
+    for start in range(0,n,rows):
+        if(indices is None):
+            block=points[start:start+rows]
+            bnorms=norms[start:start+rows]
+        else:
+            part=indices[start:start+rows]
+            block=points[part]
+            bnorms=norms[part]
+        dist=block@centroids.T
+        dist*=-2.0
+        dist+=bnorms[:,None]
+        dist+=cnorms
+        numpy.maximum(dist,0.0,out=dist)
+        yield (start,dist)
+
+
+def _two_smallest(dist):
+    """Returns: a tuple (labels, first, second) for the 2D array dist.
+
+    labels[i] is argmin(dist[i]) (ties go to the earlier column), first[i]
+    is dist[i,labels[i]] and second[i] is the smallest of the other entries
+    of dist[i] (inf if dist has only one column).
+
+    Parameter dist: the distances to search
+    Precondition: dist is a 2D numpy array with at least one column
+    """
+    rows=numpy.arange(len(dist))
+    labels=numpy.argmin(dist,axis=1)
+    first=dist[rows,labels]
+    if(dist.shape[1]==1):
+        return (labels,first,numpy.full(len(dist),numpy.inf))
+    rest=dist.copy()
+    rest[rows,labels]=numpy.inf
+    return (labels,first,rest.min(axis=1))
 
-        Often, we want to access a point in the data set, but we want a copy
-        to make sure that we do not accidentally modify the data set.  That
-        is the purpose of this method.
 
-        If you actually want to modify the data set, use the method
-        getContents().
-        That returns the list storing the data set, and any changes to that
-        list will alter the data set.
+def _seed_kmeanspp(points, k, rng, weights=None):
+    """Returns: a 1D numpy array of k indices of points chosen by k-means++.
 
-        Parameter i: the index position of the point
-        Precondition: i is an int that refers to a valid position in
-        0..getSize()-1
-        """
-        assert type(i)==int and 0<=i<self.getSize()
+    The first index is chosen uniformly (or in proportion to weights).
+    Every further index is chosen with probability proportional to the
+    squared distance from the point to the nearest point chosen so far
+    (times its weight).  Those nearest distances are updated with one pass
+    over the points per chosen index.
 
-        array = self.getContents()
-        point = array[i]
-        return point
+    Parameter points: the points to choose from
+    Precondition: points is a 2D numpy array of floats with at least k rows
 
+    Parameter k: the number of indices to choose
+    Precondition: k is an int > 0
 
-    def addPoint(self,point):
-        """Adds a COPY of point at the end of _contents.
+    Parameter rng: the source of randomness
+    Precondition: rng is a numpy.random.Generator
 
-        This method does not add the point directly. It adds a copy of the
-        point.
+    Parameter weights: the weight of each point (optional)
+    Precondition: weights is None or a 1D numpy array of positive floats
+    with one entry per point
+    """
+    n=len(points)
+    if(weights is None):
+        weights=numpy.ones(n)
+    chosen=numpy.empty(k,dtype=numpy.intp)
+    chosen[0]=numpy.searchsorted(numpy.cumsum(weights),
+        rng.random()*weights.sum(),side='right')
+    chosen[0]=min(chosen[0],n-1)
+    mind=_sq_distances(points,points[chosen[:1]])[:,0]
+    for j in range(1,k):
+        chance=numpy.cumsum(mind*weights)
+        if(chance[-1]>0):
+            pick=numpy.searchsorted(chance,rng.random()*chance[-1],side='right')
+            pick=min(pick,n-1)
+        else:
+            # Every point sits on a chosen one, so fall back to uniform
+            rest=numpy.setdiff1d(numpy.arange(n),chosen[:j])
+            pick=rest[rng.integers(len(rest))]
+        chosen[j]=pick
+        numpy.minimum(mind,_sq_distances(points,points[[pick]])[:,0],out=mind)
+    return chosen
+
+
+def _seed_kmeanspar(points, k, rng, rounds=5, limit=BLOCK_BYTES,
+        weights=None):
+    """Returns: a 1D numpy array of k indices of points chosen by k-means||.
+
+    k-means|| (Bahmani et al.) replaces the k sequential passes of
+    k-means++ with a few oversampling rounds.  Starting from one uniform
+    choice, each round keeps every point independently with probability
+    2k * (its squared distance to the candidates) / (the sum of those
+    distances).  The candidates are then weighted by how many points are
+    nearest to them, and k-means++ picks the final k among them.  With
+    weights, the first choice, the distances and the counts are all
+    weighted, as in _seed_kmeanspp.
+
+    Every pass over the points goes a block at a time (see
+    _block_distances), keeping only the running nearest distance (and
+    candidate) of each point, so about 2k*rounds candidates never make an
+    n-by-candidates array.
+
+    Parameter points: the points to choose from
+    Precondition: points is a 2D numpy array of floats with at least k rows
+
+    Parameter k: the number of indices to choose
+    Precondition: k is an int > 0
+
+    Parameter rng: the source of randomness
+    Precondition: rng is a numpy.random.Generator
+
+    Parameter rounds: the number of oversampling rounds
+    Precondition: rounds is an int >= 0
+
+    Parameter limit: the number of bytes a block may use (optional)
+    Precondition: limit is an int > 0
+
+    Parameter weights: the weight of each point (optional)
+    Precondition: weights is None or a 1D numpy array of positive floats
+    with one entry per point
+    """
+    n=len(points)
+    norms=_sq_norms(points)
+    if(weights is None):
+        cand=[int(rng.integers(n))]
+        weights=numpy.ones(n)
+    else:
+        first=numpy.searchsorted(numpy.cumsum(weights),
+            rng.random()*weights.sum(),side='right')
+        cand=[int(min(first,n-1))]
+    mind=_sq_distances(points,points[cand])[:,0]
+    for r in range(rounds):
+        score=weights*mind
+        total=score.sum()
+        if(total==0):
+            break
+        keep=rng.random(n)<2.0*k*score/total
+        keep[cand]=False
+        new=numpy.flatnonzero(keep)
+        if(len(new)==0):
+            continue
+        cand.extend(new.tolist())
+        for start,dist in _block_distances(points,points[new],norms,
+                norms[new],limit):
+            part=mind[start:start+len(dist)]
+            numpy.minimum(part,dist.min(axis=1),out=part)
+
+    cand=numpy.array(cand,dtype=numpy.intp)
+    if(len(cand)<k):
+        rest=numpy.setdiff1d(numpy.arange(n),cand)
+        more=rng.choice(rest,k-len(cand),replace=False)
+        cand=numpy.concatenate([cand,more])
+
+    near=numpy.empty(n,dtype=numpy.intp)
+    for start,dist in _block_distances(points,points[cand],norms,norms[cand],
+            limit):
+        near[start:start+len(dist)]=numpy.argmin(dist,axis=1)
+    counts=numpy.bincount(near,weights=weights,minlength=len(cand))
+    counts[counts==0]=1e-12
+    return cand[_seed_kmeanspp(points[cand],k,rng,counts)]
+
+
+def _block_rows(dim, k, limit=BLOCK_BYTES):
+    """Returns: the number of points to handle at a time when measuring
+    them against k centroids, so that about limit bytes are in use.
+
+    Parameter dim: the point dimension
+    Precondition: dim is an int > 0
+
+    Parameter k: the number of centroids
+    Precondition: k is an int > 0
+
+    Parameter limit: the number of bytes to use (optional)
+    Precondition: limit is an int > 0
+    """
+    return max(limit//(8*(dim+k)),1)
 
-        Parameter point: the point to add
-        Precondition: point is a list of numbers (int or float),
-        len(point) = _dimension.
-        """
-        assert is_point(point)
-        assert len(point)==self._dim
 
-        p=list(point)
-        self._contents.append(p)
+def _label_dtype(k):
+    """Returns: the smallest unsigned numpy integer type that can hold the
+    labels 0..k-1 plus one more value meaning "no cluster".
 
+    Parameter k: the number of clusters
+    Precondition: k is an int, 0 < k < 2**32-1
+    """
+    for dtype in (numpy.uint8,numpy.uint16,numpy.uint32):
+        if(k<numpy.iinfo(dtype).max):
+            return numpy.dtype(dtype)
+    assert False
 
-    # PROVIDED METHODS: Do not modify!
-    def __str__(self):
-        """Returns: String representation of the centroid of this cluster."""
-        return str(self._contents)
 
+def _resized(array, capacity):
+    """Returns: a new 1D numpy array of the type of array with room for
+    capacity values, starting with the values of array.
 
-    def __repr__(self):
-        """Returns: Unambiguous representation of this cluster. """
-        return str(self.__class__) + str(self)
+    Parameter array: the values to keep
+    Precondition: array is a 1D numpy array
 
+    Parameter capacity: the length of the result
+    Precondition: capacity is an int >= len(array)
+    """
+    result=numpy.empty(capacity,dtype=array.dtype)
+    result[:len(array)]=array
+    return result
 
-class Cluster(object):
-    """An instance is a cluster, a subset of the points in a dataset.
 
-    A cluster is represented as a list of integers that give the indices
-    in the dataset of the points contained in the cluster.  For instance,
-    a cluster consisting of the points with indices 0, 4, and 5 in the
-    dataset's data array would be represented by the index list [0,4,5].
+def _cluster_sums(points, labels, k, weights=None):
+    """Returns: a tuple (sums, counts) for the points grouped by label.
 
-    A cluster instance also contains a centroid that is used as part of
-    the k-means algorithm.  This centroid is an n-D point (where n is
-    the dimension of the dataset), represented as a list of n numbers,
-    not as an index into the dataset.  (This is because the centroid
-    is generally not a point in the dataset, but rather is usually in between
-    the data points.)
+    sums[j] is the coordinate sum of the points with label j, and counts[j]
+    is their number.  If weights are given, each point counts weight times:
+    sums[j] is the weighted sum and counts[j] the total weight (a float).
 
-    Instance Attributes:
-        _dataset: the dataset this cluster is a subset of  [Dataset]
+    Parameter points: the points to add up
+    Precondition: points is a 2D numpy array of floats
 
-        _indices: the indices of this cluster's points in the dataset
-        [list of int]
+    Parameter labels: the label of each point
+    Precondition: labels is a 1D numpy array of ints in 0..k-1, one per point
 
-        _centroid: the centroid of this cluster  [list of numbers]
+    Parameter k: the number of labels
+    Precondition: k is an int > 0
 
-    ADDITIONAL INVARIANTS:
-        len(_centroid) == _dataset.getDimension()
-        0 <= _indices[i] < _dataset.getSize(), for all 0 <= i < len(_indices)
+    Parameter weights: the weight of each point (optional)
+    Precondition: weights is None or a 1D numpy array of floats, one per
+    point
     """
+    sums=numpy.zeros((k,points.shape[1]))
+    if(weights is None):
+        numpy.add.at(sums,labels,points)
+        return (sums,numpy.bincount(labels,minlength=k))
+    numpy.add.at(sums,labels,points*weights[:,None])
+    return (sums,numpy.bincount(labels,weights=weights,minlength=k))
+
+
+def _reduce_coreset(points, weights, size, rng):
+    """Returns: a pair (points, weights) of at most size weighted points
+    that stand for the given weighted points.
+
+    If there are no more than size points they are returned as they are.
+    Otherwise size points are drawn (with replacement) by sensitivity
+    sampling: a point is drawn with probability
+    q = w/(2W) + w*d/(2D), where w is its weight, d its squared distance
+    to the weighted mean, W the total weight and D the total weighted
+    squared distance.  A drawn point gets weight w/(size*q), so for any
+    centroids the weighted cost of the sample is an unbiased estimate of
+    the cost of the input.  Points drawn more than once are merged.
+
+    Parameter points: the points to summarize
+    Precondition: points is a 2D numpy array of floats
+
+    Parameter weights: the weight of each point
+    Precondition: weights is a 1D numpy array of positive floats, one per
+    point
+
+    Parameter size: the most points to return
+    Precondition: size is an int > 0
+
+    Parameter rng: the source of randomness
+    Precondition: rng is a numpy.random.Generator
+    """
+    if(len(points)<=size):
+        return (points,weights)
+
+    total=weights.sum()
+    mean=weights@points/total
+    dist=_sq_norms(points-mean)
+    spread=float(weights@dist)
+    if(spread>0):
+        chance=0.5*weights/total+0.5*weights*dist/spread
+    else:
+        chance=weights/total
+    chance/=chance.sum()
+    pick=rng.choice(len(points),size,p=chance)
+    drawn=weights[pick]/(size*chance[pick])
+    unique,where=numpy.unique(pick,return_inverse=True)
+    return (points[unique],numpy.bincount(where,weights=drawn))
+
+
+# HELPER FUNCTIONS FOR THE WORKER PROCESSES
+def _unlink_quietly(block):
+    """Removes the shared memory block, if it still exists.
+
+    Parameter block: the block to remove
+    Precondition: block is a multiprocessing.shared_memory.SharedMemory
+    """
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        pass
 
-    # Part A
-    def __init__(self, ds, centroid):
-        """Initializer: Creates a new empty cluster with the given centroid.
-
-        Remember that a centroid is a point and hence a list.  The
-        initializer COPIES the centroid; it does not use the original list.
-
-        IMPORTANT: READ THE PRECONDITION OF ds VERY CAREFULLY
 
-        Parameter ds: the Dataset for this cluster
-        Precondition: ds is a instance of Dataset OR a subclass of Dataset
+# The dataset points as seen by a worker process (see _attach_shared)
+_shared_block=None
+_shared_points=None
+# The lowest inertia of a finished restart, shared by all workers
+_shared_best=None
 
-        Parameter centroid: the centroid point (which might not be a point in
-        ds)
-        Precondition: centroid is a list of numbers (int or float),
-          len(centroid) = ds.getDimension()
-        """
-        assert isinstance(ds,Dataset) or issubclass(ds,Dataset)
-        assert is_point(centroid)
-        assert len(centroid)==ds.getDimension()
 
-        copy = []
-        for x in centroid:
-            copy.append(x)
-        self._ds = ds
-        self._centroid=copy
-        self._indices=[]
+def _attach_shared(name, shape, dtype, offset=None, best=None):
+    """Maps the points of the dataset into this worker.
 
+    This is the initializer of the worker processes of ClusterGroup.  The
+    points are read in place, from a shared memory block or from the file
+    of a memory-mapped dataset; they are never pickled.
 
-    def getCentroid(self):
-        """Returns: the centroid of this cluster.
+    Parameter name, shape, dtype, offset: the points as described by
+    Dataset.share()
+    Precondition: the block or file exists and holds an array of this
+    shape and dtype
 
-        This getter method is to protect access to the centroid.
-        """
-        copy=list(self._centroid)
-        return copy
+    Parameter best: the shared lowest inertia of a finished restart
+    (optional)
+    Precondition: best is None or a multiprocessing.Value of type 'd'
+    """
+    global _shared_block, _shared_points, _shared_best
+    _shared_best=best
+    if(offset is None):
+        _shared_block=shared_memory.SharedMemory(name=name)
+        _shared_points=numpy.ndarray(shape,dtype=dtype,
+            buffer=_shared_block.buf)
+    else:
+        _shared_points=numpy.memmap(name,dtype=dtype,mode='r',offset=offset,
+            shape=shape)
 
 
-    def getIndices(self):
-        """Returns: the indices of points in this cluster
+def _partition_shard(start, stop, norms, centroids, cnorms,
+        limit=BLOCK_BYTES):
+    """Returns: a tuple (labels, sums, counts) for the shared points in
+    start..stop-1.
 
-        This method returns the attribute _indices directly.  Any changes
-        made to this list will modify the cluster.
-        """
-        return self._indices
+    labels gives the nearest centroid of each point, measured a block at a
+    time as by Dataset._assign, and sums and counts are as in
+    _cluster_sums.
 
+    Parameter start, stop: the range of points to assign
+    Precondition: 0 <= start <= stop <= the number of shared points
 
-    def addIndex(self, index):
-        """Adds the given dataset index to this cluster.
+    Parameter norms: the squared length of every point in start..stop-1,
+    as cached by the Dataset
+    Precondition: norms is a 1D numpy array of floats, one per point
 
-        If the index is already in this cluster, then this method leaves the
-        cluster unchanged.
+    Parameter centroids: the centroids to assign to
+    Precondition: centroids is a nonempty 2D numpy array of floats
 
-        Parameter index: the index of the point to add
-        Precondition: index is a valid index into this cluster's dataset.
-        That is, index is an int in the range 0.._dataset.getSize()-1.
-        """
-        assert self._ds.getContents()[index] in self._ds.getContents()
-        assert type(index)==int and 0<=index<self._ds.getSize()
+    Parameter cnorms: the squared length of every centroid
+    Precondition: cnorms is a 1D numpy array of floats, one per centroid
 
-        if (index not in self._indices):
-            self._indices.append(index)
+    Parameter limit: the number of bytes a block may use (optional)
+    Precondition: limit is an int > 0
+    """
+    points=_shared_points[start:stop]
+    labels=numpy.empty(len(points),dtype=numpy.intp)
+    for first,dist in _block_distances(points,centroids,norms,cnorms,limit):
+        labels[first:first+len(dist)]=numpy.argmin(dist,axis=1)
+    sums,counts=_cluster_sums(points,labels,len(centroids))
+    return (labels,sums,counts)
 
 
-    def clear(self):
-        """Removes all points from this cluster, but leave the centroid
-        unchanged.
-        """
-        indices=self.getIndices()
-        del indices[:]
+def _restart_shared(k, options, seed, maxstep, abandon):
+    """Returns: the result of ClusterGroup._restart on the shared points.
 
+    This is the task run by the worker processes of a multi-restart run.
+    See ClusterGroup._restart for the parameters.
+    """
+    ds=Dataset._wrap(_shared_points)
+    return ClusterGroup._restart(ds,k,options,seed,maxstep,abandon,
+        _shared_best)
 
-    def getContents(self):
-        """Returns: a new list containing copies of the points in this
-        cluster.
 
-        The result is a list of list of numbers.  It has to be computed from
-        the indices.
-        """
-        array=[]
-        ds=self._ds
-        contents=ds.getContents()
-        indices=self.getIndices()
-        p=list(indices)
-        for x in p:
-            array.append(contents[x])
-        return array
+# CLASSES
+class _KDTree(object):
+    """An instance is a kd-tree over the points of a dataset, used by the
+    'kdtree' engine of ClusterGroup.
 
+    Every node covers a contiguous range perm[start:end] of point indices.
+    Internal nodes split their points at the median of their widest
+    coordinate.  Each node caches the bounding box, coordinate sum and
+    number of its points so that a whole subtree can be given to one
+    centroid without visiting its points.
 
-    # Part B
-    def distance(self, point):
-        """Returns: The euclidean distance from point to this cluster's
-        centroid.
+    Instance Attributes:
+        _points: the points of the dataset [2D numpy array of float]
 
-        Parameter point: the point to compare to this cluster's centroid
-        Precondition: point is a list of numbers (int or float),
-          len(point) = _ds.getDimension()
-        """
-        assert is_point(point)
-        assert len(point)==self._ds.getDimension()
+        _perm: point indices ordered so every node is a contiguous range
+            [1D numpy array of int]
 
-        total=0
-        dist=0
-        centroid=self.getCentroid()
-        for x in range(len(centroid)):
-            pt1=centroid[x]
-            pt2=point[x]
-            total = total + float((pt1-pt2))**2.0
-        dist=float(math.sqrt(total))
-        return dist
+        _start, _end: the range of _perm covered by each node
+            [1D numpy arrays of int]
 
+        _left, _right: the children of each node, -1 for leaves
+            [1D numpy arrays of int]
 
-    def updateCentroid(self):
-        """Returns: Trues if the centroid remains unchanged; False otherwise.
+        _lo, _hi: the corners of the bounding box of each node
+            [2D numpy arrays of float]
 
-        This method recomputes the _centroid attribute of this cluster. The
-        new _centroid attribute is the average of the points of _contents
-        (To average a point, average each coordinate separately).
+        _sum: the coordinate sum of the points of each node
+            [2D numpy array of float]
 
-        Whether the centroid "remained the same" after recomputation is
-        determined by the function numpy.allclose().  The return value
-        should be interpreted as an indication of whether the starting
-        centroid was a "stable" position or not.
+        _visits: the number of point-to-centroid distances measured by the
+            last call to filter [int >= 0]
+    """
 
-        If there are no points in the cluster, the centroid. does not change.
-        """
-        centroid=self.getCentroid()
-        cluster=self.getContents()
-        ret = True
-        if (len(cluster))>0:
-            coord = [float(sum(col))/len(col) for col in zip(*cluster)]
-            ret=numpy.allclose(coord,centroid)
-            self._centroid=list(coord)
-        return ret
+    def __init__(self, points, leafsize=32):
+        """Initializer: Builds a kd-tree over points.
 
+        Node 0 is the root.
 
-    # PROVIDED METHODS: Do not modify!
-    def __str__(self):
-        """Returns: String representation of the centroid of this cluster."""
-        return str(self._centroid)
+        Parameter points: the points to index
+        Precondition: points is a nonempty 2D numpy array of floats
 
+        Parameter leafsize: the largest number of points in a leaf
+        Precondition: leafsize is an int > 0
+        """
+        assert type(leafsize)==int and leafsize>0
+
+        self._points=points
+        self._perm=numpy.arange(len(points))
+        self._leafsize=leafsize
+        self._start=[]
+        self._end=[]
+        self._left=[]
+        self._right=[]
+        self._lo=[]
+        self._hi=[]
+        self._sum=[]
+        self._build(0,len(points))
+
+        self._start=numpy.array(self._start)
+        self._end=numpy.array(self._end)
+        self._left=numpy.array(self._left)
+        self._right=numpy.array(self._right)
+        self._lo=numpy.array(self._lo)
+        self._hi=numpy.array(self._hi)
+        self._sum=numpy.array(self._sum)
+        self._visits=0
+
+
+    def _build(self, start, end):
+        """Returns: the index of a new node covering _perm[start:end], after
+        building the subtree below it.
+
+        Parameter start, end: the range of _perm to cover
+        Precondition: start and end are ints with 0 <= start < end <= n
+        """
+        node=len(self._start)
+        pts=self._points[self._perm[start:end]]
+        self._start.append(start)
+        self._end.append(end)
+        self._left.append(-1)
+        self._right.append(-1)
+        self._lo.append(pts.min(axis=0))
+        self._hi.append(pts.max(axis=0))
+
+        width=self._hi[node]-self._lo[node]
+        if(end-start<=self._leafsize or width.max()==0):
+            self._sum.append(pts.sum(axis=0,dtype=numpy.float64))
+            return node
+
+        self._sum.append(None)
+        axis=int(numpy.argmax(width))
+        half=(end-start)//2
+        order=numpy.argpartition(pts[:,axis],half)
+        self._perm[start:end]=self._perm[start:end][order]
+        left=self._build(start,start+half)
+        right=self._build(start+half,end)
+        self._left[node]=left
+        self._right[node]=right
+        self._sum[node]=self._sum[left]+self._sum[right]
+        return node
+
+
+    def filter(self, centroids, labels, sums, counts):
+        """Assigns every point to its nearest centroid.
+
+        This is the filtering algorithm of Kanungo et al.  Walking down the
+        tree, each node keeps only the candidate centroids that could be
+        nearest to some point in its bounding box.  Once a single candidate
+        is left, the whole subtree goes to it at once.
+
+        Ties are broken in favor of the centroid with the smaller index.
+
+        Parameter centroids: the centroids to assign to
+        Precondition: centroids is a nonempty 2D numpy array of floats
+
+        Parameter labels: the array to store the label of each point in
+        Precondition: labels is a 1D numpy array of ints with one entry per
+        point
+
+        Parameter sums: the array to add the point coordinates of each
+        cluster into
+        Precondition: sums is a 2D numpy array of floats of the same shape
+        as centroids, filled with zeros
+
+        Parameter counts: the array to add the point count of each cluster
+        into
+        Precondition: counts is a 1D numpy array of ints with one entry per
+        centroid, filled with zeros
+        """
+        self._visits=0
+        self._filter(0,numpy.arange(len(centroids)),centroids,labels,sums,
+            counts)
 
-    def __repr__(self):
-        """Returns: Unambiguous representation of this cluster. """
-        return str(self.__class__) + str(self)
 
+    def _filter(self, node, cand, centroids, labels, sums, counts):
+        """Assigns the points below node to the nearest of the candidates.
 
-class ClusterGroup(object):
-    """An instance is a set of clusters of the points in a dataset.
+        See filter for the other parameters.
 
-    Instance Attributes:
-        _dataset: the dataset which this is a clustering of
-            [Dataset]
+        Parameter node: the subtree to assign
+        Precondition: node is a valid node index
 
-        _clusters: the clusters in this clustering (not empty)
-            [list of Cluster]
+        Parameter cand: the centroids that may be nearest to a point of node
+        Precondition: cand is a nonempty, increasing 1D numpy array of
+        centroid indices
+        """
+        start=self._start[node]
+        end=self._end[node]
+        if(len(cand)>1 and self._left[node]<0):
+            inds=self._perm[start:end]
+            pts=self._points[inds]
+            lab=cand[_nearest(pts,centroids[cand])]
+            labels[inds]=lab
+            numpy.add.at(sums,lab,pts)
+            counts+=numpy.bincount(lab,minlength=len(counts))
+            self._visits=self._visits+len(inds)*len(cand)
+            return
+
+        if(len(cand)>1):
+            lo=self._lo[node]
+            hi=self._hi[node]
+            zs=centroids[cand]
+            mid=(lo+hi)/2.0
+            best=int(numpy.argmin(((zs-mid)**2).sum(axis=1)))
+            # The corner of the box furthest toward each candidate
+            corner=numpy.where(zs>zs[best],hi,lo)
+            dz=((zs-corner)**2).sum(axis=1)
+            db=((zs[best]-corner)**2).sum(axis=1)
+            keep=(dz<db)|((dz==db)&(cand<cand[best]))
+            keep[best]=True
+            cand=cand[keep]
+
+        if(len(cand)==1):
+            j=cand[0]
+            labels[self._perm[start:end]]=j
+            sums[j]+=self._sum[node]
+            counts[j]+=end-start
+            return
+
+        self._filter(self._left[node],cand,centroids,labels,sums,counts)
+        self._filter(self._right[node],cand,centroids,labels,sums,counts)
+
+
+def _share_leaves(sizes, want):
+    """Returns: a 1D numpy array with the number of leaves given to each
+    child of a node of a _ClusterTree.
+
+    The want leaves of the node are shared out in proportion to the number
+    of points of each child, with at least one leaf for a child with points
+    and never more leaves than points.
+
+    Parameter sizes: the number of points of each child
+    Precondition: sizes is a 1D numpy array of ints >= 0, with at most
+    want of them > 0 and sum(sizes) >= want
+
+    Parameter want: the number of leaves of the node
+    Precondition: want is an int > 0
+    """
+    ideal=want*sizes/float(sizes.sum())
+    share=numpy.floor(ideal).astype(numpy.intp)
+    share=numpy.minimum(numpy.maximum(share,(sizes>0).astype(numpy.intp)),
+        sizes)
+    while(share.sum()<want):
+        room=numpy.where(share<sizes,ideal-share,-numpy.inf)
+        share[numpy.argmax(room)]+=1
+    while(share.sum()>want):
+        over=numpy.where(share>1,share-ideal,-numpy.inf)
+        share[numpy.argmax(over)]-=1
+    return share
+
+
+def _build_hierarchy(points, k, branching, rng, block_bytes=BLOCK_BYTES):
+    """Returns: a pair (tree, labels) of a _ClusterTree with k leaves over
+    points and the leaf of every point.
+
+    The tree is built from the top down.  The root holds all the points.
+    A node that is to have more than one leaf is split into (at most)
+    branching children by a small k-means run, seeded by k-means++, and
+    its leaves are shared out among the children in proportion to their
+    sizes.  Leaves are numbered left to right.
+
+    Parameter points: the points to cluster
+    Precondition: points is a 2D numpy array of floats with at least k rows
+
+    Parameter k: the number of leaves
+    Precondition: k is an int > 0
+
+    Parameter branching: the most children of a node
+    Precondition: branching is an int > 1
+
+    Parameter rng: the source of the seeds of the small runs
+    Precondition: rng is a numpy.random.Generator
+
+    Parameter block_bytes: the memory ceiling of the small runs (optional)
+    Precondition: block_bytes is an int > 0
     """
+    n=len(points)
+    centroids=[points.mean(axis=0)]
+    counts=[n]
+    parent=[-1]
+    leaf=[-1]
+    labels=numpy.empty(n,dtype=numpy.intp)
+    found=0
+    stack=[(0,numpy.arange(n),k)]
+    while(len(stack)>0):
+        node,members,want=stack.pop()
+        if(want==1):
+            leaf[node]=found
+            labels[members]=found
+            found+=1
+            continue
+
+        b=min(branching,want)
+        part=points if len(members)==n else points[members]
+        sub=Dataset._wrap(part)
+        group=ClusterGroup(sub,b,init='k-means++',block_bytes=block_bytes,
+            seed=int(rng.integers(2**63)))
+        group.run(SPLIT_STEPS)
+        split=numpy.asarray(group.getLabels(),dtype=numpy.intp)
+        if(numpy.count_nonzero(numpy.bincount(split,minlength=b))<2):
+            # All the points are (nearly) the same; split them evenly
+            split=numpy.arange(len(members))%b
+        sums,sizes=_cluster_sums(part,split,b)
+        share=_share_leaves(sizes,want)
+        for j in reversed(range(b)):
+            if(share[j]==0):
+                continue
+            centroids.append(sums[j]/sizes[j])
+            counts.append(int(sizes[j]))
+            parent.append(node)
+            leaf.append(-1)
+            stack.append((len(parent)-1,members[split==j],int(share[j])))
+
+    tree=_ClusterTree(numpy.array(centroids),numpy.array(counts),
+        numpy.array(parent),numpy.array(leaf))
+    return (tree,labels)
+
+
+class _ClusterTree(object):
+    """An instance is a tree of centroids, used as a coarse-to-fine index
+    by the 'hierarchical' engine of ClusterGroup and by ClusterModel.
+
+    Every leaf stands for one cluster.  Every other node has a centroid
+    that is the mean of the points below it, and a few children.  A point
+    is labeled by starting at the root and moving to the nearest child
+    until a leaf is reached, so it is measured against about
+    branching*log(k)/log(branching) centroids instead of k.  The leaf
+    reached is not always the one with the nearest centroid.
+
+    Nodes are numbered so that a parent comes before its children.  A tree
+    is never changed once made; refit makes a new one.
 
-    # Part A
-    def __init__(self, ds, k, seed_inds=None):
-        """Initializer: Creates a clustering of the dataset ds into k
-        clusters.
+    Instance Attributes:
+        _centroids: the centroid of each node [2D numpy array of float]
 
-        The clusters are initialized by randomly selecting k different points
-        from the database to be the centroids of the clusters.  If seed_inds
-        is supplied, it is a list of indices into the dataset that specifies
-        which points should be the initial cluster centroids.
+        _norms: the squared length of each centroid
+            [1D numpy array of float]
 
-        IMPORTANT: READ THE PRECONDITION OF ds VERY CAREFULLY
+        _counts: the number of points below each node
+            [1D numpy array of int]
 
-        Parameter ds: the Dataset for this cluster group
-        Precondition: ds is a instance of Dataset OR a subclass of Dataset
+        _parent: the parent of each node, -1 for the root
+            [1D numpy array of int]
 
-        Parameter k: The number of clusters (the k in k-means)
-        Precondition: k is an int, 0 < k <= ds.getSize()
+        _leaf: the cluster of each leaf, -1 for the other nodes
+            [1D numpy array of int]
 
-        Parameter seed_inds: the INDEXES of the points to start with
-        Precondition: seed_inds is None, or a list of k valid indices into ds.
-        """
-        assert isinstance(ds,Dataset) or issubclass(ds,Dataset)
-        assert type(k)==int and 0<k<=ds.getSize()
-        assert valid_seed_inds(ds,k,seed_inds)
+        _children: row i lists the children of node i, padded with -1
+            [2D numpy array of int]
 
-        centroids=[]
-        clusters=[]
-        if(seed_inds is None):
-            rand_cent=random.sample(ds.getContents(),k)
-            for x in rand_cent:
-                centroids.append(x)
-        else:
-            for x in seed_inds:
-                centroids.append(ds.getContents()[x])
+        _depth: the depth of each node, 0 for the root
+            [1D numpy array of int]
+    """
 
-        for x in range(k):
-            clusters.append(Cluster(ds,centroids[x]))
+    def __init__(self, centroids, counts, parent, leaf):
+        """Initializer: Creates a tree from the arrays describing its nodes.
 
-        self._ds=ds
-        self._k=k
-        self._seed_inds=seed_inds
-        self._clusters=clusters
+        Parameter centroids, counts, parent, leaf: the initial values of
+        the attributes of the same names
+        Precondition: they describe a tree as in the class invariant, with
+        node 0 the root
+        """
+        m=len(parent)
+        kids=numpy.bincount(parent[1:],minlength=m)
+        children=numpy.full((m,max(int(kids.max()),1)),-1,dtype=numpy.intp)
+        depth=numpy.zeros(m,dtype=numpy.intp)
+        filled=numpy.zeros(m,dtype=numpy.intp)
+        for node in range(1,m):
+            up=parent[node]
+            children[up,filled[up]]=node
+            filled[up]+=1
+            depth[node]=depth[up]+1
+
+        self._centroids=centroids
+        self._norms=_sq_norms(centroids)
+        self._counts=counts
+        self._parent=parent
+        self._leaf=leaf
+        self._children=children
+        self._depth=depth
+
+
+    def getCentroids(self):
+        """Returns: a 2D numpy array whose row j is the centroid of the
+        leaf of cluster j.
+        """
+        leaves=numpy.flatnonzero(self._leaf>=0)
+        result=numpy.empty((len(leaves),self._centroids.shape[1]))
+        result[self._leaf[leaves]]=self._centroids[leaves]
+        return result
 
 
-    def getClusters(self):
-        """Returns: The list of clusters in this object.
+    def relabel(self, clusters):
+        """Returns: a new tree like this one in which the leaf of cluster j
+        stands for cluster clusters[j] instead.
 
-        This method returns the attribute _clusters directly.  Any changes
-        made to this list will modify the set of clusters.
+        Parameter clusters: the new cluster of each leaf
+        Precondition: clusters is a 1D numpy array of ints, a permutation
+        of 0..k-1, where k is the number of leaves
         """
-        return self._clusters
+        leaf=numpy.where(self._leaf>=0,clusters[self._leaf],-1)
+        return _ClusterTree(self._centroids,self._counts,self._parent,leaf)
 
 
-    # Part B
-    def _nearest_cluster(self, point):
-        """Returns: Cluster nearest to point
+    def refit(self, centroids, counts):
+        """Returns: a new tree with the same shape as this one for the given
+        cluster centroids.
 
-        This method uses the distance method of each Cluster to compute the
-        distance between point and the cluster centroid. It returns the
-        Cluster that is the closest.
+        The leaves get the given centroids, and every other node the mean of
+        the centroids of its children, weighted by the number of points
+        below them.  A node with no points below it keeps its old centroid.
 
-        Ties are broken in favor of clusters occurring earlier in the list of
-        self._clusters.
+        Parameter centroids: the centroid of each cluster
+        Precondition: centroids is a 2D numpy array of floats with one row
+        per leaf
 
-        Parameter point: the point to match
-        Precondition: point is a list of numbers (int or float),
-          len(point) = self._dataset.getDimension().
+        Parameter counts: the number of points of each cluster
+        Precondition: counts is a 1D numpy array of ints >= 0, one per leaf
         """
-        assert is_point(point)
-        assert len(point)==self._ds.getDimension()
-
-        clusters=self.getClusters()
-        lowest=clusters[0].distance(point)
-        clust=clusters[0]
-        for x in range(0,len(clusters)-1):
-            distance=clusters[x+1].distance(point)
-            if(distance<lowest):
-                lowest = distance
-                clust = clusters[x+1]
-        return clust
+        leaves=numpy.flatnonzero(self._leaf>=0)
+        new=self._centroids.copy()
+        total=numpy.zeros(len(new))
+        new[leaves]=centroids[self._leaf[leaves]]
+        total[leaves]=counts[self._leaf[leaves]]
+        sums=numpy.zeros(new.shape)
+        for level in range(int(self._depth.max()),0,-1):
+            nodes=numpy.flatnonzero(self._depth==level)
+            up=self._parent[nodes]
+            numpy.add.at(sums,up,total[nodes,None]*new[nodes])
+            numpy.add.at(total,up,total[nodes])
+            inner=numpy.flatnonzero((self._depth==level-1)&(self._leaf<0))
+            inner=inner[total[inner]>0]
+            new[inner]=sums[inner]/total[inner,None]
+        return _ClusterTree(new,total.astype(numpy.intp),self._parent,
+            self._leaf)
+
+
+    def descend(self, points, limit=BLOCK_BYTES):
+        """Returns: a pair (labels, measured) of the cluster of the leaf
+        reached by every point and the number of point-to-centroid
+        distances measured on the way.
+
+        Each level of the tree is one vectorized pass over the points that
+        have not reached a leaf yet, a block at a time so that about limit
+        bytes are in use.  Ties go to the earlier child.
+
+        Parameter points: the points to label
+        Precondition: points is a 2D numpy array of floats with as many
+        columns as the centroids
+
+        Parameter limit: the number of bytes a block may use (optional)
+        Precondition: limit is an int > 0
+        """
+        n,d=points.shape
+        b=self._children.shape[1]
+        node=numpy.zeros(n,dtype=numpy.intp)
+        measured=0
+        rows=_block_rows(d*b,b,limit)
+        while True:
+            moving=numpy.flatnonzero(self._leaf[node]<0)
+            if(len(moving)==0):
+                break
+            for start in range(0,len(moving),rows):
+                part=moving[start:start+rows]
+                cand=self._children[node[part]]
+                valid=cand>=0
+                dots=numpy.einsum('id,ibd->ib',points[part],
+                    self._centroids[cand])
+                dist=self._norms[cand]-2.0*dots
+                dist[~valid]=numpy.inf
+                pick=numpy.argmin(dist,axis=1)
+                node[part]=cand[numpy.arange(len(part)),pick]
+                measured+=int(valid.sum())
+        return (self._leaf[node],measured)
+
+
+class Dataset(object):
+    """Instance is a dataset for k-means clustering.
+
+    The data is stored in a contiguous 2D numpy array (the buffer).  Each
+    row of the buffer is a data point.  The buffer usually has more rows than
+    there are points so that addPoint does not have to reallocate every time;
+    only the first _size rows hold data.
+
+    Instance Attributes:
+        _dimension: the point dimension for this dataset
+            [int > 0. Value never changes after initialization]
+
+        _dtype: the floating point type of the buffer
+            [numpy.dtype. Value never changes after initialization]
+
+        _buffer: the storage for the dataset contents
+            [2D numpy array of _dtype with _dimension columns]
+
+        _size: the number of points in this dataset
+            [int, 0 <= _size <= len(_buffer)]
+
+        _shm: the shared memory block that _buffer lives in, or None if
+            the buffer is private to this process (see share())
+            [multiprocessing.shared_memory.SharedMemory, or None]
+
+        _path: the file _buffer is mapped from, or None if the points are
+            in memory (see fromFile())
+            [str, or None]
+
+        _offset: the position of the first point in the file _path
+            [int >= 0]
+
+        _norms: the squared length of every point, or None if they have
+            not been asked for yet (see getNorms())
+            [1D numpy array of floats with len(_norms) >= _size, or None]
+
+        _listeners: the cluster groups told about every point added to
+            this data set and every weight changed by dedup mode
+            [weakref.WeakSet of ClusterGroup]
+
+        _weights: the weight of every point, or None if every point has
+            weight 1 (see getWeights())
+            [1D numpy array of floats with len(_weights) >= _size, or None]
+
+        _dedup: in dedup mode, a hash table from the bytes of each point to
+            its index; None otherwise (see isDedup())
+            [dict of bytes to int, or None]
+
+    ADDITIONAL INVARIANT:
+        The number of columns in _buffer is equal to _dimension, and rows
+        0.._size-1 of _buffer are the points of the dataset in order.  If
+        _norms is not None, _norms[i] is the squared length of point i.
+
+    None of the attributes should be accessed directly outside of the class
+    Dataset (e.g. in the methods of class Cluster or KMeans). Instead, this
+    class has getter and setter style methods (with the appropriate
+    preconditions) for modifying these values.
+    """
+
+    def __init__(self, dim, contents=None, dtype=numpy.float64,
+            weights=None, dedup=False):
+        """Initializer: Creates a dataset for the given point dimension.
+
+        Note that contents (which is the initial value for the dataset) is
+        optional. The initializer COPIES contents into the buffer. If
+        contents is None, the dataset starts empty.
+
+        If weights is given, the dataset is weighted: point i counts as
+        weights[i] points when clusters are averaged and their inertia is
+        measured (see getWeights()).
+
+        If dedup is True, the dataset is weighted and in dedup mode: every
+        point added (including those of contents) is hashed, and a point
+        equal to one already stored only adds its weight to that one.  On
+        data with many exact duplicates this makes the dataset, and every
+        step of clustering it, that much smaller.  The hash table costs
+        about the size of the distinct points in memory.
+
+        Parameter dim: the initial value for attribute _dimension.
+        Precondition: dim is an int > 0.
+
+        Parameter contents: the initial contents (optional).
+        Precondition: contents is either None or is a 2D list of numbers
+        (int or float) or a 2D numpy array. If contents is not None, then
+        contents if not empty and the number of columns of contents is equal
+        to dim.
+
+        Parameter dtype: the type used to store coordinates (optional).
+        Precondition: dtype is a numpy floating point type.
+
+        Parameter weights: the weight of each point (optional).
+        Precondition: weights is None, or contents is not None and weights
+        is a list or 1D numpy array of positive numbers, one per point of
+        contents.
+
+        Parameter dedup: whether to collapse duplicate points (optional).
+        Precondition: dedup is a bool.
+        """
+        assert type(dim)==int and dim > 0
+        assert valid_contents(dim,contents)
+        assert valid_dtype(dtype)
+        assert weights is None or (contents is not None and
+            valid_weights(len(contents),weights))
+        assert type(dedup)==bool
+
+        self._dim=dim
+        self._dtype=numpy.dtype(dtype)
+        if(contents is None or dedup):
+            self._buffer=numpy.empty((0,dim),dtype=self._dtype)
+        else:
+            self._buffer=numpy.array(contents,dtype=self._dtype,order='C')
+        self._size=len(self._buffer)
+        self._shm=None
+        self._path=None
+        self._offset=0
+        self._norms=None
+        self._listeners=weakref.WeakSet()
+        self._weights=None
+        self._dedup=None
+        if(dedup):
+            self._weights=numpy.ones(0)
+            self._dedup={}
+            if(contents is not None):
+                self.addPoints(contents,weights)
+        elif(weights is not None):
+            self._weights=numpy.array(weights,dtype=numpy.float64)
+
+
+    @classmethod
+    def fromFile(cls, path, dim=None, dtype=numpy.float64):
+        """Returns: a new Dataset whose points are read from a file.
+
+        The file is memory-mapped read-only, not loaded, so opening it is
+        instant whatever its size, and the operating system pages points in
+        as they are used.  The file is either a .npy file holding a 2D
+        C-ordered floating point array, or a raw file of little-endian
+        floats stored point after point.  A mapped data set cannot have
+        points added to it.
+
+        Parameter path: the name of the file
+        Precondition: path is a string naming a .npy file or raw file as
+        described above
+
+        Parameter dim: the point dimension, for raw files
+        Precondition: dim is None for a .npy file; otherwise an int > 0 and
+        the file size is a multiple of dim floats
+
+        Parameter dtype: the type of the floats, for raw files
+        Precondition: dtype is a numpy floating point type
+        """
+        assert type(path)==str
+        assert valid_dtype(dtype)
+
+        if(dim is None):
+            mapped=numpy.load(path,mmap_mode='r')
+            assert mapped.ndim==2 and mapped.shape[1]>0
+            assert valid_dtype(mapped.dtype) and mapped.flags.c_contiguous
+            offset=mapped.offset
+        else:
+            assert type(dim)==int and dim>0
+            offset=0
+            little=numpy.dtype(dtype).newbyteorder('<')
+            mapped=numpy.memmap(path,dtype=little,mode='r')
+            assert len(mapped)%dim==0
+            mapped=mapped.reshape(-1,dim)
+
+        result=cls._wrap(mapped)
+        result._path=path
+        result._offset=offset
+        return result
+
+
+    @classmethod
+    def _wrap(cls, array):
+        """Returns: a new Dataset whose buffer is array itself, not a copy.
+
+        Parameter array: the points of the data set
+        Precondition: array is a 2D numpy array of floats with at least one
+        column
+        """
+        result=cls(array.shape[1],None,array.dtype)
+        result._buffer=array
+        result._size=len(array)
+        return result
+
+
+    @classmethod
+    def fromText(cls, path, delimiter=',', columns=None, dtype=numpy.float64,
+            skip=0, chunk_rows=65536, progress=None, dedup=False):
+        """Returns: a new Dataset whose points are read from a delimited
+        text file, such as a CSV or TSV file.
+
+        The file is read chunk_rows lines at a time.  Each chunk is parsed
+        by numpy into one array and copied into the buffer of the data set,
+        so at no point is the file held as a list of lists.  Blank lines
+        and lines starting with # are ignored.
+
+        If progress is given, it is called after every chunk as
+        progress(rows, rate), where rows is the number of points loaded so
+        far and rate is the number of points loaded per second.
+
+        Parameter path: the name of the file
+        Precondition: path is a string naming a text file with at least one
+        point, and the same number of fields on every line
+
+        Parameter delimiter: the field separator (optional)
+        Precondition: delimiter is a nonempty string, e.g. ',' or '\\t'
+
+        Parameter columns: the fields to use as coordinates (optional)
+        Precondition: columns is None (use every field) or a nonempty list
+        of field positions (ints, starting at 0)
+
+        Parameter dtype: the type used to store coordinates (optional)
+        Precondition: dtype is a numpy floating point type
+
+        Parameter skip: the number of header lines to skip (optional)
+        Precondition: skip is an int >= 0
+
+        Parameter chunk_rows: the number of lines per chunk (optional)
+        Precondition: chunk_rows is an int > 0
+
+        Parameter progress: the progress callback (optional)
+        Precondition: progress is None or a function of two arguments
+
+        Parameter dedup: whether to collapse duplicate points into weights
+        as they are read (optional; see Dataset())
+        Precondition: dedup is a bool
+        """
+        assert type(path)==str
+        assert type(delimiter)==str and len(delimiter)>0
+        assert columns is None or (type(columns)==list and len(columns)>0)
+        assert valid_dtype(dtype)
+        assert type(skip)==int and skip>=0
+        assert type(chunk_rows)==int and chunk_rows>0
+
+        result=None
+        begin=time.perf_counter()
+        with open(path) as file:
+            for line in itertools.islice(file,skip):
+                pass
+            while True:
+                lines=list(itertools.islice(file,chunk_rows))
+                if(len(lines)==0):
+                    break
+                chunk=numpy.loadtxt(lines,delimiter=delimiter,usecols=columns,
+                    dtype=dtype,ndmin=2)
+                if(len(chunk)==0):
+                    continue
+                if(result is None):
+                    result=cls(chunk.shape[1],None,dtype,dedup=dedup)
+                result.addPoints(chunk)
+                if(progress is not None):
+                    rows=result.getSize()
+                    progress(rows,rows/max(time.perf_counter()-begin,1e-9))
+
+        assert result is not None
+        return result
+
+
+    def isMapped(self):
+        """Returns: True if the points of this data set are memory-mapped
+        from a file; False otherwise.
+        """
+        return self._path is not None
+
+
+    def getDimension(self):
+        """Returns: The point dimension of this data set.
+        """
+        return self._dim
+
+
+    def getDtype(self):
+        """Returns: The numpy type used to store the points of this data set.
+        """
+        return self._dtype
+
+
+    def getSize(self):
+        """Returns: the number of elements in this data set.
+        """
+        return self._size
+
+
+    def getContents(self):
+        """Returns: A COPY of the contents of this data set as a 2D list.
+
+        Changes made to this list do not modify the data set.  Building the
+        list costs time and memory proportional to the whole data set, so
+        code that only reads the data should use getArray() instead.
+        """
+        return self.getArray().tolist()
+
+
+    def getArray(self):
+        """Returns: A read-only view of the points of this data set.
+
+        The result is a 2D numpy array with getSize() rows and
+        getDimension() columns that shares memory with the data set, so no
+        data is copied.  It cannot be written to.  Points added after this
+        call are not visible in the view.
+        """
+        view=self._buffer[:self._size]
+        view.flags.writeable=False
+        return view
+
+
+    def isWeighted(self):
+        """Returns: True if the points of this data set have weights; False
+        if every point has weight 1.
+        """
+        return self._weights is not None
+
+
+    def getWeights(self):
+        """Returns: A read-only view of the weights of the points of this
+        data set.
+
+        A point of weight w counts as w points: clusters are averaged with
+        the weights, and the inertia of a cluster group adds up weighted
+        squared distances.  If the data set is not weighted, the result is
+        a new array of ones.
+        """
+        if(self._weights is None):
+            return numpy.ones(self._size)
+        view=self._weights[:self._size]
+        view.flags.writeable=False
+        return view
+
+
+    def getTotalWeight(self):
+        """Returns: the total weight of the points of this data set (their
+        number, if it is not weighted).
+        """
+        if(self._weights is None):
+            return float(self._size)
+        return float(self._weights[:self._size].sum())
+
+
+    def getNorms(self):
+        """Returns: A read-only view of the squared lengths of the points
+        of this data set.
+
+        The squared lengths are worked out a block at a time the first time
+        they are asked for, and then kept: addPoint and addPoints extend
+        them as points arrive, so each point is only measured once.  They
+        let distances be computed as |x|^2 - 2x.c + |c|^2, where the only
+        work per step is the matrix product x.c.
+        """
+        if(self._norms is None):
+            norms=numpy.empty(max(len(self._buffer),self._size))
+            for start,block in self.getBlocks(_block_rows(self._dim,1)):
+                norms[start:start+len(block)]=_sq_norms(block)
+            self._norms=norms
+        view=self._norms[:self._size]
+        view.flags.writeable=False
+        return view
+
+
+    def getPoint(self, i):
+        """Returns: A COPY of the point at index i in this data set.
+
+        Often, we want to access a point in the data set, but we want a copy
+        to make sure that we do not accidentally modify the data set.  That
+        is the purpose of this method.
+
+        Parameter i: the index position of the point
+        Precondition: i is an int that refers to a valid position in
+        0..getSize()-1
+        """
+        assert type(i)==int and 0<=i<self.getSize()
+
+        return self._buffer[i].tolist()
+
+
+    def addPoint(self, point, weight=1):
+        """Adds a COPY of point at the end of the data set.
+
+        This method does not add the point directly. It copies its
+        coordinates into the buffer.  When the buffer is full it is replaced
+        by one twice as large, so adding n points costs O(n) time overall.
+
+        A weight other than 1 makes the data set weighted (see
+        getWeights()).  In dedup mode (see isDedup()), a point equal to one
+        already in the data set is not stored again; the weight of the
+        stored point goes up by weight instead.
+
+        Parameter point: the point to add
+        Precondition: point is a list of numbers (int or float),
+        len(point) = _dimension, and this data set is not memory-mapped.
+
+        Parameter weight: the weight of the point (optional)
+        Precondition: weight is a positive number (int or float), and 1
+        if this data set is not weighted and one of its cluster groups does
+        not support weights (see ClusterGroup)
+        """
+        assert is_point(point)
+        assert len(point)==self._dim
+        assert not self.isMapped()
+        assert type(weight) in [int,float] and weight>0
+
+        if(self._dedup is not None):
+            self.addPoints([point],[weight])
+            return
+        if(weight!=1):
+            self._weigh()
+        if(self._size==len(self._buffer)):
+            self._grow(self._size+1)
+        self._buffer[self._size]=point
+        if(self._norms is not None):
+            row=self._buffer[self._size:self._size+1]
+            self._norms[self._size]=_sq_norms(row)[0]
+        if(self._weights is not None):
+            self._weights[self._size]=weight
+        self._size=self._size+1
+        self._added(self._size-1)
+
+
+    def addPoints(self, points, weights=None):
+        """Adds COPIES of all the given points at the end of the data set.
+
+        This is the bulk version of addPoint.  The buffer grows at most
+        once.  In dedup mode, the points are first collapsed among
+        themselves (numpy.unique), so each distinct point is looked up in
+        the hash table only once.
+
+        Parameter points: the points to add
+        Precondition: points is a 2D list of numbers or 2D numpy array with
+        _dimension columns, and this data set is not memory-mapped.
+
+        Parameter weights: the weight of each point (optional)
+        Precondition: weights is None (every point has weight 1) or a list
+        or 1D numpy array of positive numbers, one per point, all 1 if this
+        data set is not weighted and one of its cluster groups does not
+        support weights (see ClusterGroup)
+        """
+        assert points is not None and valid_contents(self._dim,points)
+        assert not self.isMapped()
+        assert valid_weights(len(points),weights)
+
+        points=numpy.asarray(points)
+        if(weights is not None):
+            weights=numpy.asarray(weights,dtype=numpy.float64)
+            if(numpy.any(weights!=1)):
+                self._weigh()
+        if(self._dedup is not None):
+            self._add_distinct(points,weights)
+            return
+
+        if(self._size+len(points)>len(self._buffer)):
+            self._grow(self._size+len(points))
+        rows=self._buffer[self._size:self._size+len(points)]
+        rows[:]=points
+        if(self._norms is not None):
+            self._norms[self._size:self._size+len(points)]=_sq_norms(rows)
+        if(self._weights is not None):
+            self._weights[self._size:self._size+len(points)]=(1.0 if weights
+                is None else weights)
+        self._size=self._size+len(points)
+        self._added(self._size-len(points))
+
+
+    def isDedup(self):
+        """Returns: True if this data set collapses duplicate points into
+        weights as they are added; False otherwise.
+        """
+        return self._dedup is not None
+
+
+    def _weigh(self):
+        """Makes this data set weighted, giving every point weight 1, if
+        it is not weighted already.
+
+        Precondition: every cluster group of this data set supports weights
+        (see ClusterGroup._takes_weights)
+        """
+        if(self._weights is None):
+            for group in list(self._listeners):
+                assert group._takes_weights(), \
+                    'a cluster group of this data set does not support weights'
+            self._weights=numpy.ones(max(len(self._buffer),self._size))
+
+
+    def _add_distinct(self, points, weights):
+        """Adds the given points in dedup mode.
+
+        Points equal to one already stored add their weight to it; the
+        others are appended, once each, in the order they first appear.
+        The cluster groups of this data set are told about both (see
+        ClusterGroup._reweigh).
+
+        Parameter points: the points to add
+        Precondition: points is a 2D numpy array with _dimension columns
+
+        Parameter weights: the weight of each point
+        Precondition: weights is None (all 1) or a 1D numpy array of
+        positive floats, one per point
+        """
+        # Adding 0.0 turns -0.0 into 0.0, so the two hash alike
+        points=numpy.asarray(points,dtype=self._dtype)+self._dtype.type(0.0)
+        if(weights is None):
+            weights=numpy.ones(len(points))
+        distinct,first,where=numpy.unique(points,axis=0,return_index=True,
+            return_inverse=True)
+        totals=numpy.bincount(where.reshape(-1),weights=weights,
+            minlength=len(distinct))
+
+        fresh=[]
+        seen=[]
+        for u in numpy.argsort(first):
+            key=distinct[u].tobytes()
+            i=self._dedup.get(key)
+            if(i is None):
+                self._dedup[key]=self._size+len(fresh)
+                fresh.append(u)
+            else:
+                seen.append((i,u))
+
+        if(len(seen)>0):
+            indices=numpy.array([i for i,u in seen],dtype=numpy.intp)
+            extra=totals[[u for i,u in seen]]
+            self._weights[indices]+=extra
+            for group in list(self._listeners):
+                group._reweigh(indices,extra)
+        if(len(fresh)>0):
+            self._dedup,table=None,self._dedup
+            try:
+                self.addPoints(distinct[fresh],totals[fresh])
+            finally:
+                self._dedup=table
+
+
+    def _listen(self, group):
+        """Makes group be told about every point added to this data set,
+        and every weight raised by dedup mode, from now on.  Only a weak
+        reference to group is kept.
+
+        Parameter group: the cluster group to tell
+        Precondition: group is a ClusterGroup of this data set
+        """
+        self._listeners.add(group)
+
+
+    def _added(self, start):
+        """Tells the listening cluster groups that the points start..
+        getSize()-1 were just added.
+
+        Parameter start: the index of the first new point
+        Precondition: start is an int, 0 <= start <= getSize()
+        """
+        for group in list(self._listeners):
+            group._points_added(start)
+
+
+    def _grow(self, minsize):
+        """Replaces the buffer with a larger one holding at least minsize
+        rows, keeping the current points.
+
+        Parameter minsize: the number of rows the new buffer needs
+        Precondition: minsize is an int > len(_buffer)
+        """
+        capacity=max(minsize,2*len(self._buffer),16)
+        bigger=numpy.empty((capacity,self._dim),dtype=self._dtype)
+        bigger[:self._size]=self._buffer[:self._size]
+        self._buffer=bigger
+        if(self._norms is not None):
+            self._norms=_resized(self._norms[:self._size],capacity)
+        if(self._weights is not None):
+            self._weights=_resized(self._weights[:self._size],capacity)
+        if(self._shm is not None):
+            # The new buffer is private; worker processes see the old points
+            self._shm.unlink()
+            self._shm=None
+
+
+    def getBlocks(self, rows):
+        """Yields: the points of this data set as a sequence of (start,
+        block) pairs, where block is a read-only view of the points
+        start..start+len(block)-1.
+
+        Working through the points a block at a time keeps both the memory
+        in use and, for memory-mapped data, the pages being read bounded.
+
+        Parameter rows: the largest number of points in a block
+        Precondition: rows is an int > 0
+        """
+        assert type(rows)==int and rows>0
+
+        points=self.getArray()
+        for start in range(0,self._size,rows):
+            yield (start,points[start:start+rows])
+
+
+    def _assign(self, centroids, cnorms=None, limit=BLOCK_BYTES):
+        """Returns: the label of the nearest centroid of every point, as a
+        1D numpy array of ints (see _nearest).
+
+        The squared distances are |x|^2 - 2x.c + |c|^2, using the cached
+        squared lengths of the points (see getNorms), so the work per
+        block is one matrix product.  The points are measured a block at a
+        time, so the block-by-k array of distances stays within about
+        limit bytes however many points there are.  The expansion loses
+        digits for data far from the origin (see ClusterGroup.getInertia).
+
+        Parameter centroids: the centroids
+        Precondition: centroids is a 2D numpy array of floats with
+        getDimension() columns
+
+        Parameter cnorms: the squared lengths of the centroids (optional)
+        Precondition: cnorms is None or a 1D numpy array of floats, one per
+        centroid
+
+        Parameter limit: the number of bytes a block may use (optional)
+        Precondition: limit is an int > 0
+        """
+        if(cnorms is None):
+            cnorms=_sq_norms(centroids)
+        norms=self.getNorms()
+        labels=numpy.empty(self._size,dtype=numpy.intp)
+        rows=_block_rows(self._dim,len(centroids),limit)
+        for start,block in self.getBlocks(rows):
+            dist=block@centroids.T
+            dist*=-2.0
+            dist+=norms[start:start+len(block),None]
+            dist+=cnorms
+            numpy.maximum(dist,0.0,out=dist)
+            labels[start:start+len(block)]=numpy.argmin(dist,axis=1)
+        return labels
+
+
+    def _sums(self, labels, k, indices=None):
+        """Returns: a tuple (sums, counts) for points grouped by label, as
+        in _cluster_sums, weighted if this data set is.  Points with a label
+        of k or more are left out.
+
+        Parameter labels: the label of each point
+        Precondition: labels is a 1D numpy array of ints >= 0, one per
+        point of indices (one per point of the data set if indices is None)
+
+        Parameter k: the number of labels
+        Precondition: k is an int > 0
+
+        Parameter indices: the points to add up (optional)
+        Precondition: indices is None (all points) or a 1D numpy array of
+        valid indices
+        """
+        weights=self._weights
+        sums=numpy.zeros((k,self._dim))
+        counts=numpy.zeros(k,dtype=numpy.intp if weights is None else
+            numpy.float64)
+        if(indices is not None):
+            inside=labels<k
+            indices=indices[inside]
+            labels=labels[inside]
+            rows=_block_rows(self._dim,k)
+            for start in range(0,len(indices),rows):
+                part=indices[start:start+rows]
+                more,found=_cluster_sums(self.getArray()[part],
+                    labels[start:start+rows],k,
+                    None if weights is None else weights[part])
+                sums+=more
+                counts+=found
+            return (sums,counts)
+
+        for start,block in self.getBlocks(_block_rows(self._dim,k)):
+            part=labels[start:start+len(block)]
+            inside=part<k
+            if(weights is None):
+                more,found=_cluster_sums(block[inside],part[inside],k)
+            else:
+                more,found=_cluster_sums(block[inside],part[inside],k,
+                    weights[start:start+len(block)][inside])
+            sums+=more
+            counts+=found
+        return (sums,counts)
+
+
+    def _rows(self, indices):
+        """Returns: the points at the given indices, as a new 2D numpy array.
+
+        Parameter indices: the points to copy
+        Precondition: indices is a 1D numpy array of valid indices
+        """
+        return self.getArray()[indices]
+
+
+    def getCoreset(self, size, seed=None, chunk_rows=65536):
+        """Returns: a new weighted Dataset of at most size points that
+        summarizes this one for k-means.
+
+        The points are read once, chunk_rows at a time, and summarized by
+        merge and reduce: each chunk is reduced to size weighted points by
+        sensitivity sampling (see _reduce_coreset), and whenever two
+        summaries stand for the same number of chunks they are merged and
+        reduced again, like the digits of a binary counter.  Only about
+        size*log2(n/chunk_rows) points are held at once besides the chunk.
+        Weights of this data set are taken into account.
+
+        The result can be clustered by a ClusterGroup in a fraction of the
+        time.  Sensitivity sampling gives a coreset: with size on the order
+        of (d*k*log(k) + log(1/p))/e**2, the weighted cost of any k
+        centroids on the summary is, with probability at least 1-p, within
+        a factor 1+e of their cost on the data, up to an additive e times
+        the cost of the single centroid at the mean (Bachem, Lucic and
+        Krause, "Scalable k-means clustering via lightweight coresets",
+        2018).  Each level of merging can add its own e, so the error grows
+        with log2(n/chunk_rows); a bigger chunk_rows means fewer levels.
+
+        Parameter size: the most points in the summary
+        Precondition: size is an int > 0
+
+        Parameter seed: the seed of the sampling (optional)
+        Precondition: seed is None or an int >= 0
+
+        Parameter chunk_rows: the number of points read at a time (optional)
+        Precondition: chunk_rows is an int > 0
+        """
+        assert type(size)==int and size>0
+        assert seed is None or (type(seed)==int and seed>=0)
+        assert type(chunk_rows)==int and chunk_rows>0
+        assert self._size>0
+
+        rng=numpy.random.default_rng(seed)
+        levels=[]
+        for start,block in self.getBlocks(chunk_rows):
+            if(self._weights is None):
+                weights=numpy.ones(len(block))
+            else:
+                weights=self._weights[start:start+len(block)].copy()
+            part=_reduce_coreset(numpy.array(block,dtype=numpy.float64),
+                weights,size,rng)
+            level=0
+            while(level<len(levels) and levels[level] is not None):
+                points=numpy.concatenate([levels[level][0],part[0]])
+                weights=numpy.concatenate([levels[level][1],part[1]])
+                part=_reduce_coreset(points,weights,size,rng)
+                levels[level]=None
+                level+=1
+            if(level==len(levels)):
+                levels.append(None)
+            levels[level]=part
+
+        parts=[x for x in levels if x is not None]
+        points=numpy.concatenate([x[0] for x in parts])
+        weights=numpy.concatenate([x[1] for x in parts])
+        points,weights=_reduce_coreset(points,weights,size,rng)
+        return Dataset(self._dim,points,self._dtype,weights)
+
+
+    def share(self):
+        """Returns: a tuple (name, shape, dtype, offset) describing where
+        another process can map the points of this data set.
+
+        For a memory-mapped data set, name is the file and offset the
+        position of the first point in it.  Otherwise offset is None and
+        name is a shared memory block.
+
+        The first call moves the buffer into a new block of shared memory,
+        which other processes can map by name without any copying or
+        pickling.  Later calls return the same block, until addPoint needs
+        a bigger buffer; the points then move back to private memory and
+        the next call makes a new block.  The block is removed when this
+        data set is garbage collected.
+        """
+        if(self.isMapped()):
+            return (self._path,(self._size,self._dim),self._dtype.str,
+                self._offset)
+        if(self._shm is None):
+            nbytes=max(self._size*self._dim*self._dtype.itemsize,1)
+            block=shared_memory.SharedMemory(create=True,size=nbytes)
+            shared=numpy.ndarray((self._size,self._dim),dtype=self._dtype,
+                buffer=block.buf)
+            shared[:]=self._buffer[:self._size]
+            self._buffer=shared
+            self._shm=block
+            weakref.finalize(self,_unlink_quietly,block)
+        return (self._shm.name,(self._size,self._dim),self._dtype.str,None)
+
+
+    # PROVIDED METHODS: Do not modify!
+    def __str__(self):
+        """Returns: String representation of the centroid of this cluster."""
+        return str(self.getContents())
+
+
+    def __repr__(self):
+        """Returns: Unambiguous representation of this cluster. """
+        return str(self.__class__) + str(self)
+
+
+class SparseDataset(Dataset):
+    """Instance is a dataset for k-means clustering whose points are mostly
+    zeros.
+
+    Only the nonzero coordinates are stored, in compressed sparse row (CSR)
+    form: the nonzeros of point i are _data[_indptr[i]:_indptr[i+1]], in
+    the columns _cols[_indptr[i]:_indptr[i+1]].  The squared length of
+    every point is worked out once, when it is added, and kept in _norms.
+    Measuring a point against k centroids then costs time proportional to
+    its number of nonzeros times k, using |x-c|^2 = |x|^2 - 2x.c + |c|^2,
+    and the memory in use grows with the number of nonzeros, not with
+    getSize()*getDimension().  Like the buffer of a Dataset, every array
+    doubles in size when it is full.
+
+    A sparse data set can only be clustered by a ClusterGroup with the
+    'lloyd' engine, 'random' seeding and n_jobs=1; the other engines need
+    the dense points.  It has no getArray() view, as its points are not
+    stored in a 2D array.  Unlike a Dataset, it works out the squared
+    lengths of its points (see getNorms()) as soon as they are added.
+
+    Instance Attributes (in addition to those of Dataset):
+        _data: the nonzero coordinates, point after point
+            [1D numpy array of _dtype]
+
+        _cols: the column of each nonzero coordinate
+            [1D numpy array of ints, the same length as _data]
+
+        _nnz: the number of nonzero coordinates in this data set
+            [int, 0 <= _nnz <= len(_data)]
+
+        _indptr: where the nonzeros of each point start
+            [1D numpy array of ints, len(_indptr) > _size]
+
+    ADDITIONAL INVARIANT:
+        _indptr[0] is 0, _indptr[_size] is _nnz, and the columns of the
+        nonzeros of a point are distinct.
+    """
+
+    def __init__(self, dim, contents=None, dtype=numpy.float64, weights=None,
+            dedup=False):
+        """Initializer: Creates a sparse dataset for the given point
+        dimension.
+
+        contents is optional and given densely; only its nonzeros are
+        kept.  The parameters are as in Dataset, except that a sparse data
+        set is never weighted and has no dedup mode.
+
+        Precondition: weights is None and dedup is False
+        """
+        assert weights is None, 'a SparseDataset cannot be weighted'
+        assert dedup==False, 'a SparseDataset has no dedup mode'
+        Dataset.__init__(self,dim,None,dtype)
+        assert valid_contents(dim,contents)
+
+        index=numpy.int32 if dim<2**31 else numpy.int64
+        self._data=numpy.empty(0,dtype=self._dtype)
+        self._cols=numpy.empty(0,dtype=index)
+        self._nnz=0
+        self._indptr=numpy.zeros(1,dtype=numpy.int64)
+        self._norms=numpy.empty(0)
+        if(contents is not None):
+            self.addPoints(contents)
+
+
+    @classmethod
+    def fromFile(cls, path, dim=None, dtype=numpy.float64):
+        """A sparse data set cannot be memory-mapped from a dense file; use
+        fromCSR.
+        """
+        assert False, 'a SparseDataset cannot be read with fromFile'
+
+
+    @classmethod
+    def _wrap(cls, array):
+        """A sparse data set cannot wrap a dense array; use fromCSR."""
+        assert False, 'a SparseDataset cannot wrap a dense array'
+
+
+    @classmethod
+    def fromCSR(cls, dim, data, indices, indptr, dtype=numpy.float64):
+        """Returns: a new SparseDataset holding COPIES of the given CSR
+        arrays.
+
+        Parameter dim: the point dimension
+        Precondition: dim is an int > 0
+
+        Parameter data: the nonzero coordinates, point after point
+        Precondition: data is a 1D array-like of numbers
+
+        Parameter indices: the column of each coordinate in data
+        Precondition: indices is a 1D array-like of ints in 0..dim-1, as
+        long as data, distinct within each point
+
+        Parameter indptr: where the coordinates of each point start in data
+        Precondition: indptr is a nondecreasing 1D array-like of ints with
+        indptr[0] == 0 and indptr[-1] == len(data)
+
+        Parameter dtype: the type used to store coordinates (optional)
+        Precondition: dtype is a numpy floating point type
+        """
+        data=numpy.asarray(data)
+        indices=numpy.asarray(indices)
+        indptr=numpy.asarray(indptr,dtype=numpy.int64)
+        assert data.ndim==1 and indices.shape==data.shape
+        assert indptr.ndim==1 and len(indptr)>0
+        assert indptr[0]==0 and indptr[-1]==len(data)
+        assert numpy.all(numpy.diff(indptr)>=0)
+        assert len(indices)==0 or (indices.min()>=0 and indices.max()<dim)
+
+        result=cls(dim,None,dtype)
+        result._append(data,indices,numpy.diff(indptr))
+        return result
+
+
+    def getNnz(self):
+        """Returns: the number of nonzero coordinates in this data set."""
+        return self._nnz
+
+
+    def getCSR(self):
+        """Returns: a tuple (data, indices, indptr) of read-only views of
+        the CSR arrays of this data set (see the class invariant).
+        """
+        views=(self._data[:self._nnz],self._cols[:self._nnz],
+            self._indptr[:self._size+1])
+        for view in views:
+            view.flags.writeable=False
+        return views
+
+
+    def getArray(self):
+        """A sparse data set has no dense view; use getCSR() instead."""
+        assert False, 'a SparseDataset has no dense array; use getCSR()'
+
+
+    def getPoint(self, i):
+        """Returns: A COPY of the point at index i in this data set, with
+        its zeros filled in.
+
+        Parameter i: the index position of the point
+        Precondition: i is an int that refers to a valid position in
+        0..getSize()-1
+        """
+        assert type(i)==int and 0<=i<self.getSize()
+
+        return self._rows(numpy.array([i]))[0].tolist()
+
+
+    def getContents(self):
+        """Returns: A COPY of the contents of this data set as a 2D list,
+        with the zeros filled in.
+        """
+        return self._rows(numpy.arange(self._size)).tolist()
+
+
+    def addPoint(self, point, weight=1):
+        """Adds the nonzeros of point at the end of the data set.
+
+        Parameter point: the point to add
+        Precondition: point is a list of numbers (int or float),
+        len(point) = _dimension
+
+        Parameter weight: the weight of the point (optional)
+        Precondition: weight is 1, as a sparse data set is never weighted
+        """
+        assert is_point(point)
+        assert len(point)==self._dim
+        assert weight==1, 'a SparseDataset cannot be weighted'
+
+        self.addPoints([point])
+
+
+    def addPoints(self, points, weights=None):
+        """Adds the nonzeros of all the given points at the end of the data
+        set.
+
+        Parameter points: the points to add
+        Precondition: points is a 2D list of numbers or 2D numpy array with
+        _dimension columns
+
+        Parameter weights: the weight of each point (optional)
+        Precondition: weights is None, as a sparse data set is never
+        weighted
+        """
+        assert points is not None and valid_contents(self._dim,points)
+        assert weights is None, 'a SparseDataset cannot be weighted'
+
+        points=numpy.asarray(points)
+        rows,cols=numpy.nonzero(points)
+        self._append(points[rows,cols],cols,
+            numpy.bincount(rows,minlength=len(points)))
+
+
+    def _append(self, data, cols, lengths):
+        """Adds points given by their nonzeros at the end of the data set.
+
+        Parameter data: the nonzero coordinates, point after point
+        Precondition: data is a 1D numpy array of numbers
+
+        Parameter cols: the column of each coordinate in data
+        Precondition: cols is a 1D numpy array of ints in 0.._dimension-1,
+        as long as data
+
+        Parameter lengths: the number of nonzeros of each new point
+        Precondition: lengths is a 1D numpy array of ints >= 0 adding up to
+        len(data)
+        """
+        size=self._size+len(lengths)
+        nnz=self._nnz+len(data)
+        if(nnz>len(self._data)):
+            capacity=max(nnz,2*len(self._data),16)
+            self._data=_resized(self._data,capacity)
+            self._cols=_resized(self._cols,capacity)
+        if(size>=len(self._indptr)):
+            capacity=max(size+1,2*len(self._indptr),16)
+            self._indptr=_resized(self._indptr,capacity)
+            self._norms=_resized(self._norms,capacity)
+
+        self._data[self._nnz:nnz]=data
+        self._cols[self._nnz:nnz]=cols
+        self._indptr[self._size+1:size+1]=self._nnz+numpy.cumsum(lengths)
+        values=self._data[self._nnz:nnz].astype(numpy.float64)
+        owner=numpy.repeat(numpy.arange(len(lengths)),lengths)
+        self._norms[self._size:size]=numpy.bincount(owner,weights=values**2,
+            minlength=len(lengths))
+        first=self._size
+        self._size=size
+        self._nnz=nnz
+        self._added(first)
+
+
+    def _entries(self, indices):
+        """Returns: a tuple (positions, lengths), where positions are the
+        places in _data of the nonzeros of the given points, point after
+        point, and lengths[i] is the number of nonzeros of point indices[i].
+
+        Parameter indices: the points
+        Precondition: indices is a 1D numpy array of valid indices
+        """
+        starts=self._indptr[indices]
+        lengths=self._indptr[indices+1]-starts
+        before=numpy.cumsum(lengths)-lengths
+        positions=numpy.repeat(starts-before,lengths)
+        positions+=numpy.arange(len(positions))
+        return (positions,lengths)
+
+
+    def getBlocks(self, rows):
+        """Yields: the points of this data set as a sequence of (start,
+        block) pairs, where block is a new dense 2D numpy array of the
+        points start..start+len(block)-1.
+
+        Parameter rows: the largest number of points in a block
+        Precondition: rows is an int > 0
+        """
+        assert type(rows)==int and rows>0
+
+        for start in range(0,self._size,rows):
+            yield (start,self._rows(numpy.arange(start,
+                min(start+rows,self._size))))
+
+
+    def _assign(self, centroids, cnorms=None, limit=BLOCK_BYTES):
+        """Returns: the label of the nearest centroid of every point, as a
+        1D numpy array of ints.
+
+        Only the nonzeros are multiplied: each block of points gives a
+        matrix of dot products x.c, and the squared distances are
+        |x|^2 - 2x.c + |c|^2 with the cached |x|^2.  Ties go to the first
+        centroid, as in _nearest.  The parameters are as in
+        Dataset._assign.
+        """
+        k=len(centroids)
+        if(cnorms is None):
+            cnorms=_sq_norms(centroids)
+        columns=numpy.ascontiguousarray(centroids.T)
+        labels=numpy.empty(self._size,dtype=numpy.intp)
+        # A block of rows points needs about rows*(average+1)*k floats
+        average=self._nnz//max(self._size,1)
+        rows=max(limit//(8*k*(average+1)),1)
+        for start in range(0,self._size,rows):
+            stop=min(start+rows,self._size)
+            first,last=self._indptr[start],self._indptr[stop]
+            dots=numpy.zeros((stop-start,k))
+            lengths=numpy.diff(self._indptr[start:stop+1])
+            full=lengths>0
+            if(last>first):
+                products=columns[self._cols[first:last]]
+                products*=self._data[first:last,None]
+                offsets=self._indptr[start:stop]-first
+                dots[full]=numpy.add.reduceat(products,offsets[full],axis=0)
+            dist=self._norms[start:stop,None]-2.0*dots+cnorms
+            labels[start:stop]=numpy.argmin(dist,axis=1)
+        return labels
+
+
+    def _sums(self, labels, k, indices=None):
+        """Returns: a tuple (sums, counts) for points grouped by label, as
+        in Dataset._sums, adding up only the nonzeros.
+        """
+        if(indices is None):
+            indices=numpy.arange(self._size)
+        inside=labels<k
+        indices=indices[inside]
+        labels=numpy.asarray(labels[inside],dtype=numpy.intp)
+        positions,lengths=self._entries(indices)
+        flat=numpy.repeat(labels,lengths)*self._dim+self._cols[positions]
+        sums=numpy.bincount(flat,weights=self._data[positions],
+            minlength=k*self._dim)
+        return (sums.reshape(k,self._dim),numpy.bincount(labels,minlength=k))
+
+
+    def _rows(self, indices):
+        """Returns: the points at the given indices, with their zeros filled
+        in, as a new 2D numpy array.
+
+        Parameter indices: the points to copy
+        Precondition: indices is a 1D numpy array of valid indices
+        """
+        positions,lengths=self._entries(indices)
+        result=numpy.zeros((len(indices),self._dim),dtype=self._dtype)
+        owner=numpy.repeat(numpy.arange(len(indices)),lengths)
+        result[owner,self._cols[positions]]=self._data[positions]
+        return result
+
+
+    def share(self):
+        """A sparse data set cannot be shared with worker processes."""
+        assert False, 'a SparseDataset cannot be shared'
+
+
+    def getCoreset(self, size, seed=None, chunk_rows=65536):
+        """A sparse data set has no coreset: the coreset of Dataset is made
+        of dense chunks and is itself dense.
+        """
+        assert False, 'a SparseDataset has no coreset'
+
+
+class Cluster(object):
+    """An instance is a cluster, a subset of the points in a dataset.
+
+    A cluster is represented as a list of integers that give the indices
+    in the dataset of the points contained in the cluster.  For instance,
+    a cluster consisting of the points with indices 0, 4, and 5 in the
+    dataset's data array would be represented by the index list [0,4,5].
+
+    A cluster that belongs to a ClusterGroup does not keep its own list.
+    The group keeps one array with the label (cluster number) of every
+    point, and the indices of the cluster are worked out from it when
+    asked for.  In that case each point is in at most one cluster of the
+    group, so adding a point to a cluster takes it out of the others.
+
+    A cluster instance also contains a centroid that is used as part of
+    the k-means algorithm.  This centroid is an n-D point (where n is
+    the dimension of the dataset), represented as a list of n numbers,
+    not as an index into the dataset.  (This is because the centroid
+    is generally not a point in the dataset, but rather is usually in between
+    the data points.)
+
+    Instance Attributes:
+        _dataset: the dataset this cluster is a subset of  [Dataset]
+
+        _indices: the indices of this cluster's points in the dataset
+        [list of int, or None if the cluster belongs to a group]
+
+        _centroid: the centroid of this cluster  [list of numbers]
+
+        _norm: the squared length of _centroid, worked out whenever the
+        centroid changes  [float >= 0]
+
+        _group: the group whose label array holds the points of this
+        cluster  [ClusterGroup, or None]
+
+        _label: the number of this cluster in _group  [int, or None]
+
+        _sum: the coordinate sum of the points of this cluster, kept up to
+        date by _group as points join and leave  [1D numpy array of float,
+        or None if the cluster does not belong to a group]
+
+        _count: the number of points in this cluster, kept up to date by
+        _group  [int, or None if the cluster does not belong to a group]
+
+    ADDITIONAL INVARIANTS:
+        len(_centroid) == _dataset.getDimension()
+        0 <= _indices[i] < _dataset.getSize(), for all 0 <= i < len(_indices)
+    """
+
+    # Part A
+    def __init__(self, ds, centroid):
+        """Initializer: Creates a new empty cluster with the given centroid.
+
+        Remember that a centroid is a point and hence a list.  The
+        initializer COPIES the centroid; it does not use the original list.
+
+        IMPORTANT: READ THE PRECONDITION OF ds VERY CAREFULLY
+
+        Parameter ds: the Dataset for this cluster
+        Precondition: ds is a instance of Dataset OR a subclass of Dataset
+
+        Parameter centroid: the centroid point (which might not be a point in
+        ds)
+        Precondition: centroid is a list of numbers (int or float),
+          len(centroid) = ds.getDimension()
+        """
+        assert isinstance(ds,Dataset) or issubclass(ds,Dataset)
+        assert is_point(centroid)
+        assert len(centroid)==ds.getDimension()
+
+        copy = []
+        for x in centroid:
+            copy.append(x)
+        self._ds = ds
+        self._centroid=copy
+        self._cache_norm()
+        self._indices=[]
+        self._group=None
+        self._label=None
+        self._sum=None
+        self._count=None
+
+
+    def _join(self, group, label):
+        """Makes group's label array hold the points of this cluster.
+
+        The cluster must be empty when it joins.
+
+        Parameter group: the group this cluster belongs to
+        Precondition: group is a ClusterGroup over the same dataset
+
+        Parameter label: the number of this cluster in group
+        Precondition: label is an int, 0 <= label < the number of clusters
+        """
+        assert len(self._indices)==0
+
+        self._group=group
+        self._label=label
+        self._indices=None
+        self._sum=numpy.zeros(self._ds.getDimension())
+        self._count=0
+
+
+    def _shift(self, total, count):
+        """Adds total to the running coordinate sum of this cluster and
+        count to its running number of points.
+
+        The group calls this with the sums of the points that joined minus
+        those of the points that left.
+
+        Parameter total: the change in the coordinate sum
+        Precondition: total is a 1D numpy array of _ds.getDimension() floats
+
+        Parameter count: the change in the number of points (the total
+        weight, for a weighted dataset)
+        Precondition: count is an int, or a float for a weighted dataset
+        """
+        self._sum+=total
+        self._count=self._count+count
+        if(abs(self._count)<=1e-12*abs(count)):
+            # Do not let rounding leave a residue in an empty cluster
+            self._count=self._count*0
+            self._sum[:]=0.0
+
+
+    def _reset(self, total, count):
+        """Sets the running coordinate sum and number of points of this
+        cluster.
+
+        Parameter total: the coordinate sum of the points of this cluster
+        Precondition: total is a 1D numpy array of _ds.getDimension() floats
+
+        Parameter count: the number of points in this cluster (the total
+        weight, for a weighted dataset)
+        Precondition: count is an int >= 0, or a float >= 0 for a weighted
+        dataset
+        """
+        self._sum=numpy.array(total,dtype=numpy.float64)
+        self._count=count
+
+
+    def getCentroid(self):
+        """Returns: the centroid of this cluster.
+
+        This getter method is to protect access to the centroid.
+        """
+        copy=list(self._centroid)
+        return copy
+
+
+    def setCentroid(self, centroid):
+        """Sets the centroid of this cluster to a COPY of centroid.
+
+        The points in the cluster are left unchanged.
+
+        Parameter centroid: the new centroid
+        Precondition: centroid is a list of numbers (int or float),
+          len(centroid) = _ds.getDimension()
+        """
+        assert is_point(centroid)
+        assert len(centroid)==self._ds.getDimension()
+
+        self._centroid=list(centroid)
+        self._cache_norm()
+
+
+    def _cache_norm(self):
+        """Sets _norm to the squared length of the centroid."""
+        centroid=numpy.array([self._centroid],dtype=numpy.float64)
+        self._norm=float(_sq_norms(centroid)[0])
+
+
+    def getIndices(self):
+        """Returns: the indices of points in this cluster
+
+        This method returns the attribute _indices directly.  Any changes
+        made to this list will modify the cluster.
+
+        If the cluster belongs to a group, the result is a new list (in
+        increasing order) worked out from the group's labels, and changing
+        it does not change the cluster.
+        """
+        if(self._group is None):
+            return self._indices
+        return self._members().tolist()
+
+
+    def _members(self):
+        """Returns: the indices of points in this cluster as a 1D numpy
+        array, in increasing order.
+
+        For a cluster in a group the array is a read-only slice of the
+        group's order (see ClusterGroup._members_of).
+        """
+        if(self._group is None):
+            return numpy.array(self._indices,dtype=numpy.intp)
+        return self._group._members_of(self._label)
+
+
+    def addIndex(self, index):
+        """Adds the given dataset index to this cluster.
+
+        If the index is already in this cluster, then this method leaves the
+        cluster unchanged.
+
+        Parameter index: the index of the point to add
+        Precondition: index is a valid index into this cluster's dataset.
+        That is, index is an int in the range 0.._dataset.getSize()-1.
+        """
+        assert type(index)==int and 0<=index<self._ds.getSize()
+
+        if(self._group is not None):
+            self._group._relabel([index],self._label)
+        elif (index not in self._indices):
+            self._indices.append(index)
+
+
+    def addIndices(self, indices):
+        """Adds all of the given dataset indices to this cluster.
+
+        This is the bulk version of addIndex.  Indices already in this
+        cluster, and repeats within indices, are skipped.
+
+        Parameter indices: the indices of the points to add
+        Precondition: indices is a sequence of ints (or 1D numpy array of
+        ints), each a valid index into this cluster's dataset.
+        """
+        indices=numpy.asarray(indices,dtype=numpy.intp)
+        assert indices.ndim==1
+        assert len(indices)==0 or \
+            (indices.min()>=0 and indices.max()<self._ds.getSize())
+
+        if(self._group is not None):
+            self._group._relabel(indices,self._label)
+            return
+        # Keep the first of any repeated index, in the order given
+        indices=indices[numpy.sort(numpy.unique(indices,return_index=True)[1])]
+        if(len(self._indices)>0):
+            keep=numpy.isin(indices,self._indices,invert=True)
+            indices=indices[keep]
+        self._indices.extend(indices.tolist())
+
+
+    def clear(self):
+        """Removes all points from this cluster, but leave the centroid
+        unchanged.
+        """
+        if(self._group is not None):
+            self._group._relabel(self._members(),None)
+            return
+        indices=self.getIndices()
+        del indices[:]
+
+
+    def getContents(self):
+        """Returns: a new list containing copies of the points in this
+        cluster.
+
+        The result is a list of list of numbers.  It has to be computed from
+        the indices.
+        """
+        return self._ds._rows(self._members()).tolist()
+
+
+    def iterIndices(self):
+        """Returns: an iterator over the indices of points in this cluster.
+
+        Unlike getIndices, no list is made.  A cluster in a group yields its
+        indices in increasing order, as they were when the iterator was
+        made; changes to the group afterwards do not affect it.  A cluster
+        on its own yields from its list of indices, so it must not be
+        changed while iterating.
+        """
+        if(self._group is None):
+            return iter(self._indices)
+        return (int(i) for i in self._members())
+
+
+    def iterPoints(self):
+        """Returns: a generator of the points in this cluster, one 1D
+        numpy array at a time, in the order of iterIndices.
+
+        For a dense dataset each point is a read-only view of its row of the
+        dataset, so nothing is copied.  The points of a sparse dataset are
+        filled in a block of rows at a time.  Either way the memory used
+        does not grow with the size of the cluster.
+        """
+        indices=self._members()
+        if(not isinstance(self._ds,SparseDataset)):
+            array=self._ds.getArray()
+            for i in indices:
+                yield array[i]
+            return
+        rows=_block_rows(self._ds.getDimension(),1)
+        for start in range(0,len(indices),rows):
+            for x in self._ds._rows(indices[start:start+rows]):
+                yield x
+
+
+    def getArray(self):
+        """Returns: a new 2D numpy array whose rows are the points in this
+        cluster, in the order of iterIndices.
+
+        Only the rows of the cluster are read from the dataset, so this
+        takes time and memory proportional to the size of the cluster (a
+        memory-mapped dataset reads just those rows from disk).  The array
+        has the type of the dataset.
+        """
+        return self._ds._rows(self._members())
+
+
+    # Part B
+    def distance(self, point):
+        """Returns: The euclidean distance from point to this cluster's
+        centroid.
+
+        The squared distance is |p|^2 - 2p.c + |c|^2, with the cached
+        squared length of the centroid.  When the point is so close to the
+        centroid that this loses most of its digits to rounding, the
+        differences are squared and added up instead.
+
+        Parameter point: the point to compare to this cluster's centroid
+        Precondition: point is a list of numbers (int or float),
+          len(point) = _ds.getDimension()
+        """
+        assert is_point(point)
+        assert len(point)==self._ds.getDimension()
+
+        p=numpy.array(point,dtype=numpy.float64)
+        c=numpy.array(self._centroid,dtype=numpy.float64)
+        psq=float(p@p)
+        total=psq-2.0*float(p@c)+self._norm
+        if(total<=1e-8*(psq+self._norm)):
+            total=float((p-c)@(p-c))
+        return float(math.sqrt(max(total,0.0)))
+
+
+    def updateCentroid(self, total=None, count=None):
+        """Returns: Trues if the centroid remains unchanged; False otherwise.
+
+        This method recomputes the _centroid attribute of this cluster. The
+        new _centroid attribute is the average of the points of _contents
+        (To average a point, average each coordinate separately).  If the
+        coordinate sum and number of the points are already known, they may
+        be passed in instead, and the points are not visited.  A cluster in
+        a group always knows them: the group keeps a running sum and count
+        for each cluster as points join and leave it.
+
+        Whether the centroid "remained the same" after recomputation is
+        determined by the function numpy.allclose().  The return value
+        should be interpreted as an indication of whether the starting
+        centroid was a "stable" position or not.
+
+        If there are no points in the cluster, the centroid. does not change.
+
+        Parameter total: the coordinate sum of the points (optional)
+        Precondition: total is None or a sequence of numbers of length
+        _ds.getDimension()
+
+        Parameter count: the number of points (optional)
+        Precondition: count is None if total is None; otherwise an int
+        equal to len(getIndices()), or for a weighted dataset the float
+        total weight of those points (total then being their weighted sum)
+        """
+        centroid=self.getCentroid()
+        if(total is None and self._group is not None):
+            total=self._sum
+            count=self._count
+        if(total is not None):
+            assert len(total)==len(centroid) and type(count) in (int,float)
+            ret = True
+            if(count>0):
+                coord=[float(x)/count for x in total]
+                ret=numpy.allclose(coord,centroid)
+                self._centroid=coord
+                self._cache_norm()
+            return ret
+
+        if(self._ds.isWeighted() and len(self._indices)>0):
+            indices=numpy.array(self._indices,dtype=numpy.intp)
+            sums,counts=self._ds._sums(numpy.zeros(len(indices),
+                dtype=numpy.intp),1,indices)
+            return self.updateCentroid(sums[0],counts[0].item())
+
+        cluster=self.getContents()
+        ret = True
+        if (len(cluster))>0:
+            coord = [float(sum(col))/len(col) for col in zip(*cluster)]
+            ret=numpy.allclose(coord,centroid)
+            self._centroid=list(coord)
+            self._cache_norm()
+        return ret
+
+
+    # PROVIDED METHODS: Do not modify!
+    def __str__(self):
+        """Returns: String representation of the centroid of this cluster."""
+        return str(self._centroid)
+
+
+    def __repr__(self):
+        """Returns: Unambiguous representation of this cluster. """
+        return str(self.__class__) + str(self)
+
+
+class ClusterGroup(object):
+    """An instance is a set of clusters of the points in a dataset.
+
+    Instance Attributes:
+        _dataset: the dataset which this is a clustering of
+            [Dataset]
+
+        _clusters: the clusters in this clustering (not empty)
+            [list of Cluster]
+
+        _engine: the method used to partition the points
+            [one of the strings in ENGINES]
+
+        _labels: the number of the cluster of each point, or _unassigned
+            for points in no cluster (all of them, before the first
+            partition).  The clusters of the group keep no lists of their
+            own; their points are read from this array.
+            [1D numpy array of unsigned int, of the type _label_dtype(k)]
+
+        _unassigned: the label meaning "no cluster"
+            [int, the largest value of the type of _labels]
+
+        _skipped: the number of point-to-centroid distance evaluations
+            avoided by each partition so far
+            [list of int]
+
+        _reassigned: the number of points that changed cluster in the last
+            partition, or None if there has not been one
+            [int >= 0, or None]
+
+        _step_count: the number of steps performed so far
+            [int >= 0]
+
+        _sums: the coordinate sum of each cluster's points, if the engine
+            computed it from scratch during the last partition, or None.
+            Otherwise the running sums of the clusters are adjusted for the
+            points that moved.
+            [2D numpy array of float, or None]
+
+        _counts: the number of points in each cluster, if the engine
+            computed it during the last partition, or None
+            [1D numpy array of int, or None]
+
+        _block_bytes: about how many bytes the points-by-centroids
+            distances of a partition ('lloyd', 'minibatch', 'hamerly',
+            'approx' and 'hierarchical', with or without n_jobs) or of
+            getInertia may take at once  [int > 0]
+
+        _spare: the array _labels is the front of, with room for more
+            points, or None (see _pad_labels)
+            [1D numpy array of the type of _labels, or None]
+
+        _order: the points sorted by label and the position in that order
+            where each cluster starts (see _members_of), or None until the
+            labels are next asked for by cluster
+            [pair of read-only 1D numpy arrays of int, or None]
+
+    Attributes used for online learning (see setOnline):
+        _online: whether points added to the dataset are learned at once
+            [bool]
+
+        _rate: the smallest learning rate of an online update, or None for
+            a rate of 1/(the number of points in the cluster)
+            [float in (0,1], or None]
+
+    Attributes used only by the 'hamerly' engine (None until the first
+    partition):
+        _upper: upper bound on the distance from each point to its centroid
+            [1D numpy array of float, or None]
+
+        _lower: lower bound on the distance from each point to every other
+            centroid
+            [1D numpy array of float, or None]
+
+        _bound_centroids: the centroids the bounds were computed against
+            [2D numpy array of float, or None]
+
+        _bound_labels: the labels the bounds were computed for
+            [1D numpy array of int, or None]
+
+        _bound_scale: the largest absolute coordinate of the points, which
+            sets the rounding slack of the pruning test  [float, or None]
+
+    Attributes used by the 'minibatch' engine and by partialFit:
+        _batch_size: the number of points sampled by each step
+            [int > 0]
+
+        _seen: the number of points each centroid has been moved toward so
+            far; 1/_seen[j] is the learning rate of centroid j
+            [1D numpy array of int]
+
+        _rng: the random generator used to sample batches
+            [numpy.random.Generator]
+
+    Attributes used for running the 'lloyd' partition on several cores:
+        _n_jobs: the number of worker processes [int > 0]
+
+        _pool: the worker processes, or None if they have not been started
+            [concurrent.futures.ProcessPoolExecutor, or None]
+
+        _pool_block: the shared dataset block the workers are attached to
+            [tuple as returned by Dataset.share(), or None]
+
+    Attributes used for restarts:
+        _seed: the seed all random choices come from [int >= 0]
+
+        _init: how the initial centroids were chosen
+            [one of the strings in SEEDINGS]
+
+        _n_init: the number of restarts run performs [int > 0]
+
+        _restarts: a pair (seed, inertia) for every restart of the last
+            run, in order, where inertia is None for abandoned restarts
+            [list of tuples]
+
+    Attributes used only by the 'approx' engine:
+        _candidates: the number of centroids measured exactly per point
+            [int > 0]
+
+        _projections: the dimension of the random projection [int > 0]
+
+        _projected: a pair (matrix, points) of the projection matrix and
+            the projected points, or None before they are first needed
+            [tuple of 2D numpy arrays, or None]
+
+        _gaps: the estimated relative inertia lost to approximation in
+            each partition so far [list of float]
+
+    Attributes used only by the 'kdtree' engine:
+        _tree: the kd-tree over the dataset, or None before the first
+            partition [_KDTree, or None]
+
+    Attributes used only by the 'hierarchical' engine:
+        _branching: the most children of a node of the cluster tree
+            [int > 1]
+
+        _hierarchy: the cluster tree, or None before the first partition
+            [_ClusterTree, or None]
+
+        _kept: True if the centroids were not chosen by this group's own
+            seeding (they were restored by loadCheckpoint or taken from the
+            best restart), so the first partition builds the tree over them
+            instead of over the points  [bool]
+    """
+
+    # Part A
+    def __init__(self, ds, k, seed_inds=None, engine='lloyd', batch_size=1024,
+            init='random', n_jobs=1, seed=None, n_init=1, candidates=8,
+            projections=16, block_bytes=BLOCK_BYTES, branching=8):
+        """Initializer: Creates a clustering of the dataset ds into k
+        clusters.
+
+        The clusters are initialized by selecting k different points from
+        the database to be the centroids of the clusters.  With init
+        'random' they are chosen uniformly.  'k-means++' chooses them one at
+        a time, favoring points far from those already chosen, which
+        usually means far fewer steps to converge.  'k-means||' gets a
+        similar result from a few passes over the data instead of k, which
+        is faster for very large datasets.  If seed_inds is supplied, it is
+        a list of indices into the dataset that specifies which points
+        should be the initial cluster centroids, and init is ignored.
+
+        If ds is weighted (see Dataset.getWeights), a point of weight w
+        counts as w points: centroids are weighted means, the inertia is
+        weighted, k-means++ seeding and 'minibatch' sampling favor heavy
+        points, and n points of total weight W cluster like W points but at
+        the cost of n.  That is how a coreset (Dataset.getCoreset) is
+        clustered.  The 'kdtree' and 'hierarchical' engines and n_jobs > 1
+        do not support weights.
+
+        The engine selects how each step partitions the points.  'lloyd'
+        measures every point against every centroid.  'hamerly' keeps
+        distance bounds for each point and only measures the points whose
+        cluster might have changed; it produces the same clusters as
+        'lloyd' and is faster once few points move between steps.  'kdtree'
+        builds a kd-tree over the dataset once and gives whole subtrees to
+        a centroid at a time; it works best for low dimensional data (up to
+        about 8 dimensions) with well separated clusters.  'minibatch' does
+        not partition the whole dataset each step: it moves the centroids
+        toward a random batch of batch_size points, with a learning rate for
+        each centroid that shrinks as it sees more points.  The clusters are
+        only repartitioned at the end of run.  'approx' is for high
+        dimensions and many clusters: it measures each point only against
+        a shortlist of `candidates` likely centroids, namely the centroids
+        nearest to that of the point's current cluster, or for points not
+        yet in a cluster, those nearest to it in a random projection to
+        `projections` dimensions.  Points may then end up in a cluster
+        that is not quite the nearest; getInertiaGaps() reports how much
+        that costs.  'hierarchical' is for very large k: the first
+        partition ignores the initial centroids and builds the clusters
+        top down, splitting the points into at most `branching` parts
+        with a small k-means run, then each part again, until there are k
+        leaves.  The tree of centroids is kept as an index, and later
+        partitions label each point by walking down it, so they cost time
+        proportional to branching*log(k) per point instead of k.  As with
+        'approx', a point may end up in a cluster that is not quite the
+        nearest.  Models made by getModel() reuse the tree.
+
+        Chunks of points that are not in the dataset at all can be learned
+        with partialFit, in any engine.
+
+        If n_jobs is more than 1, the 'lloyd' partition (also used at the
+        end of a 'minibatch' run) is split across that many worker
+        processes.  The dataset is moved into shared memory (see
+        Dataset.share) so the workers read the points in place; each worker
+        returns the labels and per-cluster sums of its share of the points.
+        Call close() to stop the workers when done.
+
+        If seed is given, all random choices of this group come from it, so
+        two groups made with the same seed cluster the same way.
+
+        If n_init is more than 1, run clusters the data n_init times from
+        different starts, and keeps the one with the lowest inertia (see
+        run).  Each restart gets its own seed, derived from seed, so the
+        restarts are reproducible too.  With n_jobs more than 1 the
+        restarts run at the same time in worker processes, all reading the
+        same shared copy of the dataset.
+
+        The 'lloyd' partition measures points against centroids a block of
+        points at a time, so that the array of their distances takes about
+        block_bytes bytes.  A bigger block makes fewer, larger matrix
+        products; a smaller one keeps memory use down when k is large.
+
+        IMPORTANT: READ THE PRECONDITION OF ds VERY CAREFULLY
+
+        Parameter ds: the Dataset for this cluster group
+        Precondition: ds is a instance of Dataset OR a subclass of Dataset
+
+        Parameter k: The number of clusters (the k in k-means)
+        Precondition: k is an int, 0 < k <= ds.getSize()
+
+        Parameter seed_inds: the INDEXES of the points to start with
+        Precondition: seed_inds is None, or a list of k valid indices into ds.
+
+        Parameter engine: the partition method (optional)
+        Precondition: engine is one of the strings in ENGINES
+
+        Parameter batch_size: the points sampled per 'minibatch' step
+        (optional)
+        Precondition: batch_size is an int > 0
+
+        Parameter init: how to choose the initial centroids (optional)
+        Precondition: init is one of the strings in SEEDINGS
+
+        Parameter n_jobs: the number of worker processes (optional)
+        Precondition: n_jobs is an int > 0
+
+        Parameter seed: the seed of the random choices (optional)
+        Precondition: seed is None or an int >= 0
+
+        Parameter n_init: the number of restarts run performs (optional)
+        Precondition: n_init is an int > 0, and n_init is 1 if seed_inds is
+        not None
+
+        Parameter candidates: the shortlist length of 'approx' (optional)
+        Precondition: candidates is an int > 0
+
+        Parameter projections: the projected dimension of 'approx'
+        (optional)
+        Precondition: projections is an int > 0
+
+        Parameter block_bytes: the memory ceiling of a block (optional)
+        Precondition: block_bytes is an int > 0
+
+        Parameter branching: the most children of a node of the
+        'hierarchical' cluster tree (optional)
+        Precondition: branching is an int > 1
+        """
+        assert isinstance(ds,Dataset) or issubclass(ds,Dataset)
+        assert type(k)==int and 0<k<=ds.getSize()
+        assert valid_seed_inds(ds,k,seed_inds)
+        assert engine in ENGINES
+        assert type(batch_size)==int and batch_size>0
+        assert init in SEEDINGS
+        assert type(n_jobs)==int and n_jobs>0
+        assert seed is None or (type(seed)==int and seed>=0)
+        assert type(n_init)==int and n_init>0
+        assert seed_inds is None or n_init==1
+        assert type(candidates)==int and candidates>0
+        assert type(projections)==int and projections>0
+        assert type(block_bytes)==int and block_bytes>0
+        assert type(branching)==int and branching>1
+        assert not isinstance(ds,SparseDataset) or (engine=='lloyd' and
+            init=='random' and n_jobs==1)
+        assert not ds.isWeighted() or (engine not in ['kdtree','hierarchical']
+            and n_jobs==1)
+
+        # Without a seed, uniform seeds are drawn first so random.seed gives
+        # the same clusters as it always has
+        if(seed is None):
+            if(seed_inds is None and init=='random'):
+                inds=random.sample(range(ds.getSize()),k)
+            seed=random.getrandbits(64)
+        elif(seed_inds is None and init=='random'):
+            inds=numpy.random.default_rng(seed).choice(ds.getSize(),k,
+                replace=False).tolist()
+        if(seed_inds is not None):
+            inds=seed_inds
+        rng=numpy.random.default_rng(seed)
+        if(seed_inds is None and init=='k-means++'):
+            weights=ds.getWeights() if ds.isWeighted() else None
+            inds=_seed_kmeanspp(ds.getArray(),k,rng,weights)
+        elif(seed_inds is None and init=='k-means||'):
+            weights=ds.getWeights() if ds.isWeighted() else None
+            inds=_seed_kmeanspar(ds.getArray(),k,rng,limit=block_bytes,
+                weights=weights)
+
+        clusters=[]
+        for x in inds:
+            clusters.append(Cluster(ds,ds.getPoint(int(x))))
+        for j in range(k):
+            clusters[j]._join(self,j)
+
+        self._ds=ds
+        self._k=k
+        self._seed_inds=seed_inds
+        self._clusters=clusters
+        self._engine=engine
+        dtype=_label_dtype(k)
+        self._unassigned=int(numpy.iinfo(dtype).max)
+        self._labels=numpy.full(ds.getSize(),self._unassigned,dtype=dtype)
+        self._order=None
+        self._skipped=[]
+        self._reassigned=None
+        self._step_count=0
+        self._upper=None
+        self._lower=None
+        self._bound_centroids=None
+        self._bound_labels=None
+        self._bound_scale=None
+        self._sums=None
+        self._counts=None
+        self._tree=None
+        self._batch_size=batch_size
+        self._seen=numpy.zeros(k,dtype=numpy.int64)
+        self._rng=rng
+        self._seed=seed
+        self._init=init
+        self._n_init=n_init
+        self._restarts=[]
+        self._n_jobs=n_jobs
+        self._pool=None
+        self._pool_block=None
+        self._candidates=candidates
+        self._projections=projections
+        self._projected=None
+        self._gaps=[]
+        self._block_bytes=block_bytes
+        self._spare=None
+        self._online=False
+        self._rate=None
+        self._branching=branching
+        self._hierarchy=None
+        self._kept=False
+        ds._listen(self)
+
+
+    def _options(self):
+        """Returns: a dictionary of the keyword arguments that make a new
+        cluster group work like this one (apart from its seed).
+        """
+        return {'engine': self._engine, 'batch_size': self._batch_size,
+            'init': self._init, 'n_jobs': self._n_jobs,
+            'n_init': self._n_init, 'candidates': self._candidates,
+            'projections': self._projections,
+            'block_bytes': self._block_bytes, 'branching': self._branching}
+
+
+    def getClusters(self):
+        """Returns: The list of clusters in this object.
+
+        This method returns the attribute _clusters directly.  Any changes
+        made to this list will modify the set of clusters.
+        """
+        return self._clusters
+
+
+    def getLabels(self):
+        """Returns: A read-only view of the label of every point in the
+        dataset.
+
+        Entry i is the number of the cluster (its position in getClusters())
+        that point i is in.  Points in no cluster, including points added
+        to the dataset since the last step, have the largest value of the
+        array's integer type.
+        """
+        self._pad_labels()
+        view=self._labels[:]
+        view.flags.writeable=False
+        return view
+
+
+    def _pad_labels(self):
+        """Extends _labels with _unassigned for points added to the
+        dataset since it was made.
+
+        When it has to grow, _labels becomes the front of a new array
+        (_spare) twice as long, filled with _unassigned, so that adding
+        points one at a time costs O(1) time each on average.
+        """
+        n=self._ds.getSize()
+        if(len(self._labels)>=n):
+            return
+        spare=self._spare
+        if(spare is None or self._labels.base is not spare or len(spare)<n):
+            spare=numpy.full(max(n,2*len(self._labels),16),self._unassigned,
+                dtype=self._labels.dtype)
+            spare[:len(self._labels)]=self._labels
+            self._spare=spare
+        self._labels=spare[:n]
+
+
+    def _members_of(self, label):
+        """Returns: a read-only 1D numpy array of the points in the cluster
+        with the given number, in increasing order.
+
+        The first call after the labels change sorts all the points by label
+        once, with a stable sort (a linear-time radix sort for the small
+        label types), and keeps the order in _order.  Until the labels
+        change again, the points of any cluster are then a slice of that
+        order, found in time proportional to the size of the cluster.
+
+        Parameter label: the number of the cluster
+        Precondition: label is an int, 0 <= label < k
+        """
+        if(self._order is None):
+            order=numpy.argsort(self._labels,kind='stable')
+            starts=numpy.searchsorted(self._labels[order],
+                numpy.arange(len(self._clusters)+1))
+            order.flags.writeable=False
+            self._order=(order,starts)
+        order,starts=self._order
+        return order[starts[label]:starts[label+1]]
+
+
+    def _relabel(self, indices, label):
+        """Moves the given points into the cluster with the given number.
+
+        Parameter indices: the points to move
+        Precondition: indices is a sequence of valid indices into the
+        dataset
+
+        Parameter label: the cluster number, or None to put the points in no
+        cluster
+        Precondition: label is None or an int, 0 <= label < k
+        """
+        self._pad_labels()
+        if(label is None):
+            label=self._unassigned
+        indices=numpy.unique(numpy.asarray(indices,dtype=numpy.intp))
+        self._move(indices,numpy.full(len(indices),label,
+            dtype=self._labels.dtype))
+
+
+    def _takes_weights(self):
+        """Returns: True if this group can cluster a weighted dataset;
+        False otherwise.
+
+        The 'kdtree' and 'hierarchical' engines and the worker processes of
+        n_jobs > 1 add up plain, unweighted points.
+        """
+        return self._engine not in ['kdtree','hierarchical'] and \
+            self._n_jobs==1
+
+
+    def getEngine(self):
+        """Returns: The name of the partition engine of this cluster group.
+        """
+        return self._engine
+
+
+    def getSkippedCounts(self):
+        """Returns: A list with the number of point-to-centroid distance
+        evaluations each partition so far avoided.
+
+        A partition that measures every point against every centroid skips
+        0 evaluations; the largest possible value is getSize()*k.
+        """
+        return list(self._skipped)
+
+
+    # Part B
+    def _nearest_cluster(self, point):
+        """Returns: Cluster nearest to point
+
+        This method compares the squared distance between point and each
+        cluster centroid. It returns the Cluster that is the closest.
+
+        Ties are broken in favor of clusters occurring earlier in the list of
+        self._clusters.
+
+        Parameter point: the point to match
+        Precondition: point is a list of numbers (int or float),
+          len(point) = self._dataset.getDimension().
+        """
+        assert is_point(point)
+        assert len(point)==self._ds.getDimension()
+
+        points=numpy.array([point],dtype=numpy.float64)
+        return self._clusters[_nearest(points,self._centroid_array())[0]]
+
+
+    def _centroid_array(self):
+        """Returns: a new 2D numpy array whose row j is the centroid of
+        cluster j.
+        """
+        return numpy.array([x.getCentroid() for x in self._clusters],
+            dtype=numpy.float64)
+
+
+    def _centroid_norms(self):
+        """Returns: a new 1D numpy array whose entry j is the squared length
+        of the centroid of cluster j, as cached by the cluster.
+        """
+        return numpy.array([x._norm for x in self._clusters])
 
 
     def _partition(self):
         """Repartitions the dataset so each point is in exactly one Cluster.
+
+        With the 'lloyd', 'minibatch' and 'hamerly' engines every point ends
+        up in the cluster with the nearest centroid, with the same
+        tie-breaking as _nearest_cluster.  The 'kdtree' engine also finds
+        the nearest centroid, but it measures exact distances, so a tie may
+        go to a different cluster.  The 'approx' engine only measures each
+        point against a shortlist of centroids, and the 'hierarchical'
+        engine walks each point down the cluster tree, so with either a
+        point may end up in a near cluster that is not the nearest.
+        """
+        self._sums=None
+        self._counts=None
+        if(self._engine=='hamerly'):
+            labels=self._assign_hamerly()
+        elif(self._engine=='kdtree'):
+            labels=self._assign_kdtree()
+        elif(self._engine=='approx'):
+            labels=self._assign_approx()
+        elif(self._engine=='hierarchical'):
+            labels=self._assign_hierarchy()
+        else:
+            labels=self._assign_lloyd()
+        self._set_labels(labels)
+
+
+    def _sum_clusters(self):
+        """Sets the running sums and counts of the clusters from scratch.
+
+        The points are visited a block at a time.  Points in no cluster are
+        left out.
+        """
+        sums,counts=self._ds._sums(self._labels,len(self._clusters))
+        self._reset_sums(sums,counts)
+
+
+    def _reset_sums(self, sums, counts):
+        """Sets the running sum and count of cluster j to sums[j] and
+        counts[j].
+
+        Parameter sums: the coordinate sums of the clusters
+        Precondition: sums is a 2D numpy array of floats with one row per
+        cluster
+
+        Parameter counts: the numbers of points of the clusters
+        Precondition: counts is a 1D numpy array of ints (of floats, the
+        total weights, for a weighted dataset) with one entry per cluster
         """
-        # First, clear each cluster of its points.  Then, for each point in the
-        # dataset, find the nearest cluster and add the point to that cluster.
         clusters=self.getClusters()
-        for x in clusters:
-            x.clear()
+        for j in range(len(clusters)):
+            clusters[j]._reset(sums[j],counts[j].item())
+
+
+    def _move(self, indices, labels):
+        """Moves point indices[i] into the cluster with the number labels[i]
+        for every i, adjusting the running sums of the clusters.
+
+        Only the points that change cluster are visited, so this costs time
+        proportional to the number of points moved (times the dimension),
+        not to the size of the dataset.
+
+        Parameter indices: the points to move
+        Precondition: indices is a 1D numpy array of distinct valid indices
+        into the dataset
+
+        Parameter labels: the cluster number of each point, _unassigned for
+        no cluster
+        Precondition: labels is a 1D numpy array of ints as long as indices
+        """
+        old=self._labels[indices]
+        moving=old!=labels
+        indices=indices[moving]
+        old=old[moving]
+        labels=labels[moving]
+        if(len(indices)==0):
+            return
+
+        k=len(self._clusters)
+        lsums,lcounts=self._ds._sums(old,k,indices)
+        jsums,jcounts=self._ds._sums(labels,k,indices)
+        clusters=self.getClusters()
+        for j in numpy.flatnonzero((lcounts>0)|(jcounts>0)):
+            clusters[j]._shift(jsums[j]-lsums[j],(jcounts[j]-lcounts[j]).item())
+        self._labels[indices]=labels
+        self._order=None
+
+
+    def _assign_lloyd(self):
+        """Returns: the label of the nearest cluster of every point.
+
+        All points are measured against all centroids, a block of points at
+        a time (see Dataset._assign), using the cached squared lengths of
+        the points and centroids.
+        """
+        self._skipped.append(0)
+        if(self._n_jobs>1):
+            return self._assign_parallel()
+
+        return self._ds._assign(self._centroid_array(),
+            self._centroid_norms(),self._block_bytes)
+
+
+    def _assign_parallel(self):
+        """Returns: the label of the nearest cluster of every point.
+
+        The points are split into contiguous shards, several per worker so
+        that a slow worker does not hold up the rest.  Each worker is sent
+        the cached squared lengths of its shard's points, assigns its shard
+        and adds up its clusters; the parent stitches the labels together
+        and reduces the sums and counts into _sums and _counts.
+        """
+        block=self._ds.share()
+        if(self._pool is None or self._pool_block!=block):
+            self.close()
+            self._pool=ProcessPoolExecutor(self._n_jobs,
+                initializer=_attach_shared,initargs=block)
+            self._pool_block=block
+
+        centroids=self._centroid_array()
+        cnorms=self._centroid_norms()
+        norms=self._ds.getNorms()
+        n=block[1][0]
+        edges=numpy.linspace(0,n,4*self._n_jobs+1).astype(int)
+        futures=[]
+        for s in range(len(edges)-1):
+            futures.append(self._pool.submit(_partition_shard,int(edges[s]),
+                int(edges[s+1]),norms[edges[s]:edges[s+1]],centroids,cnorms,
+                self._block_bytes))
+
+        labels=numpy.empty(n,dtype=numpy.intp)
+        self._sums=numpy.zeros(centroids.shape)
+        self._counts=numpy.zeros(len(centroids),dtype=numpy.intp)
+        for s in range(len(futures)):
+            part,sums,counts=futures[s].result()
+            labels[edges[s]:edges[s+1]]=part
+            self._sums+=sums
+            self._counts+=counts
+        return labels
+
+
+    def close(self):
+        """Stops the worker processes of this cluster group, if any.
+
+        They are started again by the next partition that needs them.
+        """
+        if(self._pool is not None):
+            self._pool.shutdown()
+            self._pool=None
+            self._pool_block=None
+
+
+    def _assign_hamerly(self):
+        """Returns: the label of the nearest cluster of every point.
+
+        This is Hamerly's variant of k-means.  For each point we keep an
+        upper bound on the distance to its own centroid and a single lower
+        bound on the distance to every other centroid.  When the centroids
+        move, the bounds are loosened by how far they moved.  A point cannot
+        change cluster if its upper bound is below both its lower bound and
+        half the distance from its centroid to the nearest other centroid,
+        so only the remaining points are measured.
+
+        Points that are measured go through the same kernel as the 'lloyd'
+        engine, and every pass over the points goes a block at a time
+        within _block_bytes (see _block_distances), and the pruning
+        test keeps a small safety margin for rounding, so the labels are the
+        same as the 'lloyd' engine's.
+        """
+        points=self._ds.getArray()
+        norms=self._ds.getNorms()
+        centroids=self._centroid_array()
+        cnorms=self._centroid_norms()
+        n=len(points)
+        k=len(centroids)
+
+        if(self._bound_labels is None or len(self._bound_labels)!=n):
+            labels=numpy.empty(n,dtype=numpy.intp)
+            first=numpy.empty(n)
+            second=numpy.empty(n)
+            for start,dist in _block_distances(points,centroids,norms,cnorms,
+                    self._block_bytes):
+                stop=start+len(dist)
+                labels[start:stop],first[start:stop],second[start:stop]=\
+                    _two_smallest(dist)
+            self._upper=numpy.sqrt(first)
+            self._lower=numpy.sqrt(second)
+            self._bound_scale=0.0
+            for start,block in self._ds.getBlocks(_block_rows(
+                    points.shape[1],1,self._block_bytes)):
+                self._bound_scale=max(self._bound_scale,
+                    float(numpy.abs(block).max()))
+            self._bound_centroids=centroids
+            self._bound_labels=labels
+            self._skipped.append(0)
+            return labels
+
+        labels=self._bound_labels.copy()
+        upper=self._upper
+        lower=self._lower
+
+        # Loosen the bounds by how far each centroid moved
+        moved=numpy.sqrt(numpy.einsum('ij,ij->i',
+            centroids-self._bound_centroids,centroids-self._bound_centroids))
+        upper+=moved[labels]
+        if(k>1):
+            order=numpy.argsort(moved)
+            biggest=numpy.where(labels==order[-1],moved[order[-2]],
+                moved[order[-1]])
+            lower-=biggest
+        self._bound_centroids=centroids
+
+        # Half the distance from each centroid to its nearest neighbor
+        if(k>1):
+            between=numpy.sqrt(_sq_distances(centroids,centroids))
+            numpy.fill_diagonal(between,numpy.inf)
+            half=between.min(axis=1)/2.0
+        else:
+            half=numpy.full(1,numpy.inf)
+
+        # Rounding in the distance kernel grows with the size of the vectors
+        scale=self._bound_scale+float(numpy.abs(centroids).max())
+        eps=numpy.finfo(numpy.float64).eps
+        slack=4.0*math.sqrt(points.shape[1]*eps)*scale
+
+        bound=numpy.maximum(lower,half[labels])-slack
+        cand=numpy.flatnonzero(upper>bound)
+
+        # Tighten the upper bound of the candidates and test again
+        rows=_block_rows(points.shape[1],1,self._block_bytes)
+        for start in range(0,len(cand),rows):
+            part=cand[start:start+rows]
+            diff=points[part]-centroids[labels[part]]
+            upper[part]=numpy.sqrt(numpy.einsum('ij,ij->i',diff,diff))
+        tightened=len(cand)
+        cand=cand[upper[cand]>bound[cand]]
+
+        # Measure the rest against every centroid
+        for start,dist in _block_distances(points,centroids,norms,cnorms,
+                self._block_bytes,cand):
+            part=cand[start:start+len(dist)]
+            newlabels,first,second=_two_smallest(dist)
+            labels[part]=newlabels
+            upper[part]=numpy.sqrt(first)
+            lower[part]=numpy.sqrt(second)
+
+        checked=tightened+len(cand)*k
+        self._skipped.append(max(n*k-checked,0))
+        self._bound_labels=labels
+        return labels
+
+
+    def _assign_kdtree(self):
+        """Returns: the label of the nearest cluster of every point.
+
+        The kd-tree is built on the first call (and again if points have
+        been added since).  As a side effect the per-cluster coordinate sums
+        and counts are stored in _sums and _counts, so that _update does not
+        have to visit the points.
+        """
+        points=self._ds.getArray()
+        centroids=self._centroid_array()
+        n=len(points)
+        k=len(centroids)
+        if(self._tree is None or len(self._tree._perm)!=n):
+            self._tree=_KDTree(points)
+
+        labels=numpy.zeros(n,dtype=numpy.intp)
+        self._sums=numpy.zeros((k,points.shape[1]))
+        self._counts=numpy.zeros(k,dtype=numpy.intp)
+        self._tree.filter(centroids,labels,self._sums,self._counts)
+        self._skipped.append(max(n*k-self._tree._visits,0))
+        return labels
+
+
+    def _set_centroids(self, centroids):
+        """Sets the centroid of cluster j to row j of centroids.
+
+        Parameter centroids: the new centroids
+        Precondition: centroids is a 2D numpy array of floats with one row
+        per cluster and _ds.getDimension() columns
+        """
+        clusters=self.getClusters()
+        for j in range(len(clusters)):
+            clusters[j].setCentroid(centroids[j].tolist())
+
+
+    def _learn(self, batch):
+        """Returns: True if no centroid moved noticeably; False otherwise.
+
+        This method moves the centroids toward the points of batch.  Each
+        point pulls its nearest centroid by 1/(the number of points that
+        centroid has seen so far), which makes every centroid the running
+        mean of the points it has been given.  The points of batch are not
+        added to any cluster.
+
+        Parameter batch: the points to learn from
+        Precondition: batch is a nonempty 2D numpy array of floats with
+        _ds.getDimension() columns
+        """
+        centroids=self._centroid_array()
+        labels=_nearest(batch,centroids)
+        found=numpy.bincount(labels,minlength=len(centroids))
+        sums=numpy.zeros(centroids.shape)
+        numpy.add.at(sums,labels,batch)
+
+        self._seen+=found
+        hit=found>0
+        moved=centroids.copy()
+        pull=sums[hit]-found[hit,None]*centroids[hit]
+        moved[hit]+=pull/self._seen[hit,None]
+        self._set_centroids(moved)
+        return numpy.allclose(moved,centroids)
+
+
+    def _minibatch_step(self):
+        """Returns: True if no centroid moved noticeably; False otherwise.
+
+        This method learns from a batch of _batch_size points sampled (with
+        replacement) from the dataset.  In a weighted dataset, points are
+        sampled in proportion to their weights.
+        """
+        points=self._ds.getArray()
+        if(self._ds.isWeighted()):
+            chance=numpy.cumsum(self._ds.getWeights())
+            draws=self._rng.random(self._batch_size)*chance[-1]
+            inds=numpy.searchsorted(chance,draws,side='right')
+            inds=numpy.sort(numpy.minimum(inds,len(points)-1))
+        else:
+            inds=numpy.sort(self._rng.integers(0,len(points),
+                self._batch_size))
+        return self._learn(points[inds])
+
+
+    def partialFit(self, chunk):
+        """Returns: True if no centroid moved noticeably; False otherwise.
+
+        This method moves the centroids toward the points of chunk, exactly
+        like one 'minibatch' step, but the points come from the caller
+        instead of the dataset.  The chunk is not stored, so a stream that
+        does not fit in memory can be clustered in bounded memory:
+
+            for chunk in chunks:
+                group.partialFit(chunk)
+
+        Parameter chunk: the points to learn from
+        Precondition: chunk is a nonempty 2D list of numbers or 2D numpy
+        array with _ds.getDimension() columns
+        """
+        assert chunk is not None
+        assert valid_contents(self._ds.getDimension(),chunk)
+
+        return self._learn(numpy.asarray(chunk,dtype=numpy.float64))
+
+
+    def _assign_hierarchy(self):
+        """Returns: the label of a near (usually the nearest) cluster of
+        every point.
 
-        ds=self._ds
-        contents=ds.getContents()
-        for i in range(ds.getSize()):
-            nearest=self._nearest_cluster(contents[i])
-            nearest.addIndex(i)
+        The first partition builds the cluster tree over the points (see
+        _build_hierarchy) and moves the centroids to its leaves.  A group
+        whose centroids are worth keeping (see _kept) builds the tree over
+        its centroids instead, one leaf each.  Every later
+        partition refits the tree to the current centroids and walks each
+        point down it (see _ClusterTree.descend).
+        """
+        points=self._ds.getArray()
+        k=len(self._clusters)
+        if(self._hierarchy is None):
+            rng=numpy.random.default_rng([self._seed,2])
+            if(not self._kept):
+                tree,labels=_build_hierarchy(points,k,self._branching,rng,
+                    self._block_bytes)
+                self._hierarchy=tree
+                self._set_centroids(tree.getCentroids())
+                self._skipped.append(0)
+                return labels
+            tree,order=_build_hierarchy(self._centroid_array(),k,
+                self._branching,rng,self._block_bytes)
+            clusters=numpy.empty(k,dtype=numpy.intp)
+            clusters[order]=numpy.arange(k)
+            self._hierarchy=tree.relabel(clusters)
+
+        counts=numpy.array([x._count for x in self._clusters])
+        self._hierarchy=self._hierarchy.refit(self._centroid_array(),counts)
+        labels,measured=self._hierarchy.descend(points,self._block_bytes)
+        self._skipped.append(len(points)*k-measured)
+        return labels
+
+
+    def setOnline(self, online, rate=None):
+        """Turns online learning on or off.
+
+        While it is on, every point added to the dataset (by addPoint or
+        addPoints) is put at once into the cluster with the nearest
+        centroid, and that centroid alone moves toward it.  By default it
+        moves by 1/(the number of points now in the cluster), which keeps
+        it the mean of the points the cluster has been given.  If rate is
+        given, it moves by at least rate, so older points are forgotten at
+        an exponential rate and the clusters follow data that drifts.  Each
+        new point costs O(k*d) time; the other points are not looked at,
+        and they are only repartitioned when step or run is called.
+
+        With the 'minibatch' engine, whose clusters are only filled at the
+        end of run, the count that sets the rate is the number of points
+        the centroid has learned from (as in partialFit).
+
+        In a weighted dataset a point of weight w moves the centroid by
+        w/(the weight now in the cluster).  When dedup mode raises the
+        weight of a point that is already in a cluster, that centroid
+        moves toward it in the same way by the added weight.  (With online
+        learning off, the running sums of the clusters still take the new
+        weight into account, but the centroids wait for the next step.)
+
+        Parameter online: whether to learn added points at once
+        Precondition: online is a bool
+
+        Parameter rate: the smallest learning rate (optional)
+        Precondition: rate is None or a float, 0 < rate <= 1
+        """
+        assert type(online)==bool
+        assert rate is None or (type(rate)==float and 0<rate<=1)
+
+        self._online=online
+        self._rate=rate
+
+
+    def isOnline(self):
+        """Returns: True if points added to the dataset are learned at once
+        (see setOnline); False otherwise.
+        """
+        return self._online
+
+
+    def _points_added(self, start):
+        """Learns the points start..getSize()-1 just added to the dataset,
+        if online learning is on (see setOnline).
+
+        Parameter start: the index of the first new point
+        Precondition: start is an int, 0 <= start <= _ds.getSize()
+        """
+        if(self._online):
+            self._pad_labels()
+            self._learn_points(numpy.arange(start,self._ds.getSize()))
+
+
+    def _reweigh(self, indices, extra):
+        """Takes into account that the weights of the given points of the
+        dataset just went up.
+
+        With online learning the points are learned as described in
+        setOnline.  Otherwise the running sums of the clusters the points
+        are in are adjusted, and the centroids are left alone.
+
+        Parameter indices: the points whose weights went up
+        Precondition: indices is a 1D numpy array of distinct valid indices
+
+        Parameter extra: how much each weight went up
+        Precondition: extra is a 1D numpy array of positive floats, one per
+        index
+        """
+        self._pad_labels()
+        if(self._online):
+            self._learn_points(indices,extra)
+            return
+
+        labels=self._labels[indices]
+        inside=labels!=self._unassigned
+        if(not numpy.any(inside)):
+            return
+        clusters=self.getClusters()
+        sums,counts=_cluster_sums(self._ds._rows(indices[inside]),
+            labels[inside].astype(numpy.intp),len(clusters),extra[inside])
+        for j in numpy.flatnonzero(counts>0):
+            clusters[j]._shift(sums[j],counts[j].item())
+
+
+    def _learn_points(self, indices, extra=None):
+        """Learns the given points one at a time, as described in
+        setOnline.
+
+        A point in no cluster is put into the one with the nearest
+        centroid, with all its weight.  A point already in a cluster (only
+        possible when extra is given) adds extra weight to it.
+
+        Parameter indices: the points to learn
+        Precondition: indices is a 1D numpy array of distinct valid indices
+
+        Parameter extra: the weight just added to each point (optional)
+        Precondition: extra is None (the points are new) or a 1D numpy
+        array of positive floats, one per index
+        """
+        points=self._ds._rows(indices)
+        weights=None
+        if(self._ds.isWeighted()):
+            weights=self._ds.getWeights()[indices]
+        centroids=self._centroid_array()
+        cnorms=self._centroid_norms()
+        clusters=self.getClusters()
+        for i in range(len(indices)):
+            x=points[i]
+            j=int(self._labels[indices[i]])
+            if(j==self._unassigned):
+                j=int(numpy.argmin(cnorms-2.0*(centroids@x)))
+                self._move(indices[i:i+1],numpy.array([j],
+                    dtype=self._labels.dtype))
+                joined=1 if weights is None else float(weights[i])
+            else:
+                joined=float(extra[i])
+                clusters[j]._shift(joined*x,joined)
+            if(self._engine=='minibatch'):
+                self._seen[j]+=1
+                rate=1.0/int(self._seen[j])
+            else:
+                rate=joined/clusters[j]._count
+            if(self._rate is not None):
+                rate=max(rate,self._rate)
+            centroids[j]+=rate*(x-centroids[j])
+            clusters[j].setCentroid(centroids[j].tolist())
+            cnorms[j]=clusters[j]._norm
+
+
+    def _assign_approx(self):
+        """Returns: the label of a near (usually the nearest) cluster of
+        every point.
+
+        Each partition first finds, for every centroid, the `_candidates`
+        centroids nearest to it (itself included).  A point that is already
+        in a cluster is then measured only against that shortlist of its
+        cluster's centroid.  Since all points of a cluster share one
+        shortlist, this is one small matrix product per cluster.  By the
+        triangle inequality, the nearest centroid is surely on the
+        shortlist if the point is closer to its cluster's centroid than
+        half the distance to the nearest centroid not on it.
+
+        The other points, and points in no cluster yet (all of them, in the
+        first partition) are shortlisted by random projection instead.  The
+        points are projected once onto `_projections` random gaussian
+        directions, and each point is measured exactly against the
+        `_candidates` centroids whose projections are nearest to its own.
+
+        Ties among a shortlist go to the earlier cluster.  Afterwards a
+        sample of up to 1000 points is also assigned exactly, and the
+        relative inertia lost on the sample is appended to _gaps.
+        """
+        points=self._ds.getArray()
+        centroids=self._centroid_array()
+        n,d=points.shape
+        k=len(centroids)
+        short=min(self._candidates,k)
+        if(short==k):
+            self._gaps.append(0.0)
+            return self._assign_lloyd()
+
+        labels=numpy.empty(n,dtype=numpy.intp)
+        old=self.getLabels()
+        known=old!=self._unassigned
+
+        # The shortlist of cluster j is safe for any point closer to c_j
+        # than half the distance to the nearest centroid not on it
+        between=_sq_distances(centroids,centroids)
+        numpy.fill_diagonal(between,-1.0)
+        ranked=numpy.argpartition(between,short,axis=1)
+        shortlists=numpy.sort(ranked[:,:short],axis=1)
+        reach=between[numpy.arange(k),ranked[:,short]]/4.0
+        order=numpy.argsort(old,kind='stable')
+        bounds=numpy.searchsorted(old[order],numpy.arange(k+1))
+        for j in range(k):
+            members=order[bounds[j]:bounds[j+1]]
+            if(len(members)>0):
+                cand=shortlists[j]
+                dist=_sq_distances(points[members],centroids[cand])
+                labels[members]=cand[numpy.argmin(dist,axis=1)]
+                own=dist[:,numpy.searchsorted(cand,j)]
+                known[members[own>reach[j]]]=False
+
+        strays=numpy.flatnonzero(~known)
+        if(len(strays)>0):
+            labels[strays]=self._assign_projected(points,strays,centroids,short)
+        self._skipped.append(n*(k-short))
+
+        sample=self._rng.choice(n,min(n,1000),replace=False)
+        exact=_sq_distances(points[sample],centroids)
+        best=exact.min(axis=1).sum()
+        got=exact[numpy.arange(len(sample)),labels[sample]].sum()
+        self._gaps.append(float((got-best)/best) if best>0 else 0.0)
+        return labels
+
+
+    def _assign_projected(self, points, indices, centroids, short):
+        """Returns: the labels of the points with the given indices, each
+        chosen among the `short` centroids whose random projections are
+        nearest to the point's projection.
+
+        The projection of the points is computed on the first call and kept
+        (see _projected).  It depends only on the seed of the group, so it
+        is the same after a checkpoint is restored.
+
+        Parameter points: the points of the dataset
+        Precondition: points is a 2D numpy array of floats
+
+        Parameter indices: the points to assign
+        Precondition: indices is a 1D numpy array of valid indices
+
+        Parameter centroids: the centroids to assign to
+        Precondition: centroids is a 2D numpy array of floats
+
+        Parameter short: the shortlist length
+        Precondition: short is an int, 0 < short <= len(centroids)
+        """
+        n,d=points.shape
+        if(self._projected is None or len(self._projected[1])!=n):
+            rng=numpy.random.default_rng([self._seed,1])
+            matrix=rng.standard_normal((d,self._projections))
+            matrix/=math.sqrt(self._projections)
+            projected=numpy.empty((n,self._projections))
+            for start,block in self._ds.getBlocks(_block_rows(d,1)):
+                projected[start:start+len(block)]=block@matrix
+            self._projected=(matrix,projected)
+        matrix,projected=self._projected
+        shadows=centroids@matrix
+
+        labels=numpy.empty(len(indices),dtype=numpy.intp)
+        rows=_block_rows(d*short,len(centroids),self._block_bytes)
+        for start in range(0,len(indices),rows):
+            part=indices[start:start+rows]
+            near=_sq_distances(projected[part],shadows)
+            cand=numpy.argpartition(near,short-1,axis=1)[:,:short]
+            cand.sort(axis=1)
+            diff=points[part][:,None,:]-centroids[cand]
+            exact=numpy.einsum('ijk,ijk->ij',diff,diff)
+            labels[start:start+len(part)]=cand[numpy.arange(len(part)),
+                numpy.argmin(exact,axis=1)]
+        return labels
+
+
+    def getInertiaGaps(self):
+        """Returns: A list with, for each partition so far, the relative
+        amount by which the inertia of the 'approx' engine exceeded that of
+        exact assignment.
+
+        Each value is measured on a random sample of up to 1000 points, by
+        comparing the distance to the cluster each point was given with the
+        distance to its truly nearest centroid.  0.01 means the sample's
+        inertia was 1% higher than exact assignment would give.  The list
+        is empty for the other engines.
+        """
+        return list(self._gaps)
+
+
+    def _set_labels(self, labels):
+        """Makes the clusters match labels.
+
+        If the engine added up the clusters itself (in _sums and _counts)
+        those sums replace the running sums.  Otherwise the running sums are
+        adjusted for the points that changed cluster, or recomputed if more
+        than half of the points did.
+
+        Parameter labels: the cluster index of every point in the dataset
+        Precondition: labels is a 1D numpy array of ints in 0..k-1 with one
+        entry per point in the dataset
+        """
+        self._pad_labels()
+        labels=labels.astype(self._labels.dtype)
+        changed=numpy.flatnonzero(self._labels!=labels)
+        self._reassigned=len(changed)
+        if(self._sums is not None):
+            self._labels=labels
+            self._order=None
+            self._reset_sums(self._sums,self._counts)
+        elif(2*len(changed)>len(labels)):
+            self._labels=labels
+            self._order=None
+            self._sum_clusters()
+        else:
+            self._move(changed,labels[changed])
 
 
     # Part C
@@ -494,6 +3754,49 @@ class ClusterGroup(object):
             return True
 
 
+    def getInertia(self):
+        """Returns: The sum of the squared distances from every point in a
+        cluster to the centroid of its cluster.
+
+        This is the quantity k-means tries to make small.  The differences
+        x-c are squared directly, a block of points at a time, rather than
+        expanded as |x|^2 - 2x.c + |c|^2: for data far from the origin that
+        expansion subtracts nearly equal large numbers and loses most of its
+        digits.  Points of a weighted dataset count with their weight.
+
+        Assignment (see Dataset._assign) does use the expansion, so it is
+        only accurate for data reasonably near the origin: when the spread
+        of the clusters is tiny next to their distance from the origin
+        (say 0.01 at 1e5), points near a boundary may go to a cluster that
+        is not quite the nearest.  Subtract the mean from such data before
+        clustering it.
+        """
+        centroids=self._centroid_array()
+        labels=self.getLabels()
+        weights=None
+        if(self._ds.isWeighted()):
+            weights=self._ds.getWeights()
+        total=0.0
+        rows=_block_rows(self._ds.getDimension(),1,self._block_bytes)
+        for start,block in self._ds.getBlocks(rows):
+            part=labels[start:start+len(block)]
+            inside=part!=self._unassigned
+            diff=block[inside]-centroids[part[inside]]
+            sq=numpy.einsum('ij,ij->i',diff,diff,dtype=numpy.float64)
+            if(weights is None):
+                total+=float(sq.sum())
+            else:
+                total+=float(sq@weights[start:start+len(block)][inside])
+        return total
+
+
+    def getReassigned(self):
+        """Returns: The number of points that changed cluster in the last
+        partition, or None if there has not been one.
+        """
+        return self._reassigned
+
+
     def step(self):
         """Returns: True if the algorithm converges after one step; False
         otherwise.
@@ -502,30 +3805,385 @@ class ClusterGroup(object):
         checks if the algorithm has converged and returns True or False
         """
         # In a cycle, we partition the points and then update the means.
+        self._step_count=self._step_count+1
+        if(self._engine=='minibatch'):
+            return self._minibatch_step()
         self._partition()
         return self._update()
 
 
+    def getStepCount(self):
+        """Returns: The number of steps this cluster group has performed,
+        including those before it was saved, if it was restored from a
+        checkpoint.
+        """
+        return self._step_count
+
+
+    def _traced_step(self):
+        """Returns: a dictionary describing one step of the algorithm, after
+        performing it.
+
+        The keys are described in run.
+        """
+        before=self._centroid_array()
+        self._step_count=self._step_count+1
+        start=time.perf_counter()
+        if(self._engine=='minibatch'):
+            middle=start
+            converged=self._minibatch_step()
+            reassigned=None
+        else:
+            self._partition()
+            middle=time.perf_counter()
+            converged=self._update()
+            reassigned=self._reassigned
+        finish=time.perf_counter()
+
+        moved=self._centroid_array()-before
+        shift=math.sqrt(float(numpy.einsum('ij,ij->i',moved,moved).max()))
+        inertia=None
+        if(self._engine!='minibatch'):
+            inertia=self.getInertia()
+        return {'partition_time': middle-start, 'update_time': finish-middle,
+            'inertia': inertia, 'reassigned': reassigned, 'shift': shift,
+            'converged': converged}
+
+
     # Part D
-    def run(self, maxstep):
-        """Continues clustering until either it converges or reaches maxstep
-        steps.
+    def run(self, maxstep, abandon=None, checkpoint=None, every=10):
+        """Returns: A list with one dictionary per step describing the run,
+        after continuing clustering until either it converges or reaches
+        maxstep steps.
 
         The stopping condition (convergence, maxsteps) is whichever comes
-        first.
+        first.  The algorithm has converged when no centroid changes, or
+        when a partition moves no point to a different cluster (since then
+        the next update could not change anything).  Each step does exactly
+        one partition and one update.
+
+        The dictionary of each step has the keys
+            'partition_time': seconds spent partitioning the points
+            'update_time': seconds spent updating the centroids
+            'inertia': the value of getInertia() after the step
+            'reassigned': the number of points that changed cluster
+            'shift': the farthest any centroid moved
+            'converged': True if this step converged
+        In the 'minibatch' engine a step does not partition, so the whole
+        step is counted as update time and 'inertia' and 'reassigned' are
+        None.
+
+        If the group was made with n_init more than 1, clustering starts
+        over n_init times from new initial centroids, and the group ends up
+        with the centroids and clusters of the restart with the lowest
+        inertia; the result describes that restart.  If abandon is given, a
+        restart is given up as soon as its inertia is more than abandon
+        times that of the best restart finished so far.  Inertia falls
+        quickly in the first steps, so the factor should be generous (2 or
+        more) to avoid giving up restarts that would have won.
+        getRestarts() describes every restart.
+
+        If checkpoint is given, the state of the group is saved to that
+        file (see saveCheckpoint) every `every` steps and when the run ends,
+        so that a job that is stopped part way can continue with
+        loadCheckpoint.  Restarts are not checkpointed individually; only
+        the chosen one is saved at the end.
 
         Precondition maxstep: Maximum number of steps before giving up
         Precondition: maxstep is int >= 0.
+
+        Parameter abandon: the factor for giving up restarts (optional)
+        Precondition: abandon is None or a number >= 1
+
+        Parameter checkpoint: the file to save the state in (optional)
+        Precondition: checkpoint is None or a string naming a writable file
+
+        Parameter every: the number of steps between checkpoints (optional)
+        Precondition: every is an int > 0
         """
-        # Call step repeatedly, up to maxstep times, until the algorithm
-        # converges.  Stop after maxstep iterations even if the algorithm has not
-        # converged.
         assert type(maxstep)==int and maxstep >=0
+        assert abandon is None or (type(abandon) in [int,float] and abandon>=1)
+        assert checkpoint is None or type(checkpoint)==str
+        assert type(every)==int and every>0
+
+        if(self._n_init>1):
+            trace=self._run_restarts(maxstep,abandon)
+        else:
+            trace=self._run_steps(maxstep,checkpoint=checkpoint,every=every)[0]
+        if(checkpoint is not None):
+            self.saveCheckpoint(checkpoint)
+        return trace
+
+
+    def start(self, maxstep, progress=None, checkpoint=None, every=10):
+        """Returns: a new ClusterJob that runs this group on a worker
+        thread, as run(maxstep, checkpoint=checkpoint, every=every) would.
+
+        The call returns at once.  The job can be waited for, awaited from
+        asyncio, or cancelled between steps; see ClusterJob.  Until the job
+        is done, the group belongs to the worker thread and must not be
+        used by anything else; read the job instead.
+
+        Parameter maxstep: Maximum number of steps before giving up
+        Precondition: maxstep is int >= 0.
+
+        Parameter progress: the function called after every step (optional)
+        Precondition: progress is None or a function taking the dictionary
+        of the step (as described in run)
+
+        Parameter checkpoint, every: as in run
+
+        Precondition: this group was made with n_init 1
+        """
+        return ClusterJob(self,maxstep,progress,checkpoint,every)
+
+
+    def _run_steps(self, maxstep, abandon=None, best=None, checkpoint=None,
+            every=10, watch=None):
+        """Returns: a pair (trace, finished) after stepping until the
+        algorithm converges, maxstep steps are done, the run is given up,
+        or watch asks to stop.
 
+        trace is as described in run.  finished is False if the run was
+        given up because its inertia exceeded abandon times best.value.
+
+        Parameter maxstep: Maximum number of steps before giving up
+        Precondition: maxstep is int >= 0.
+
+        Parameter abandon: the factor for giving up (optional)
+        Precondition: abandon is None or a number >= 1
+
+        Parameter best: the inertia to compare with (optional)
+        Precondition: best is None or has a float attribute value
+
+        Parameter checkpoint, every: as in run
+
+        Parameter watch: the function called after every step (optional)
+        Precondition: watch is None or a function taking the dictionary of
+        the step and returning True to stop the run there
+        """
+        # Call step repeatedly, up to maxstep times, until the algorithm
+        # converges.  Stop after maxstep iterations even if the algorithm
+        # has not converged.
+        trace=[]
         x = 0
-        while x < maxstep and self.step()==False:
-            self.step()
+        while x < maxstep:
+            record=self._traced_step()
+            trace.append(record)
             x=x+1
+            if(checkpoint is not None and self._step_count%every==0):
+                self.saveCheckpoint(checkpoint)
+            stop=watch is not None and watch(record)
+            if(record['converged'] or record['reassigned']==0 or stop):
+                break
+            if(abandon is not None and best is not None and
+                    record['inertia'] is not None and
+                    record['inertia']>abandon*best.value):
+                return (trace,False)
+        if(self._engine=='minibatch'):
+            self._partition()
+        return (trace,True)
+
+
+    @staticmethod
+    def _restart(ds, k, options, seed, maxstep, abandon, best):
+        """Returns: a tuple (inertia, centroids, labels, trace) describing
+        one restart, or (None, None, None, trace) if it was given up.
+
+        The restart is a new ClusterGroup made with the given seed and
+        options, run as by _run_steps.
+
+        Parameter ds: the dataset to cluster
+        Precondition: ds is a Dataset
+
+        Parameter k: the number of clusters
+        Precondition: k is an int, 0 < k <= ds.getSize()
+
+        Parameter options: the other arguments of the new group
+        Precondition: options is a dictionary of keyword arguments of
+        ClusterGroup
+
+        Parameter seed: the seed of the restart
+        Precondition: seed is an int >= 0
+
+        Parameter maxstep, abandon, best: as in _run_steps
+        """
+        group=ClusterGroup(ds,k,seed=seed,**options)
+        trace,finished=group._run_steps(maxstep,abandon,best)
+        if(not finished):
+            return (None,None,None,trace)
+        return (group.getInertia(),group._centroid_array(),
+            numpy.array(group.getLabels()),trace)
+
+
+    def _run_restarts(self, maxstep, abandon):
+        """Returns: the trace of the best of _n_init restarts, after taking
+        its centroids, clusters and step count.
+
+        The seed of each restart comes from a numpy SeedSequence made from
+        _seed.  Finished restarts lower the shared best inertia that the
+        others compare themselves with when abandon is given.  Ties are
+        broken in favor of earlier restarts.
+
+        Parameter maxstep, abandon: as in run
+        """
+        seeds=numpy.random.SeedSequence(self._seed).generate_state(
+            self._n_init,dtype=numpy.uint64)
+        seeds=[int(s) for s in seeds]
+        options=self._options()
+        options['n_jobs']=1
+        options['n_init']=1
+        best=multiprocessing.Value('d',math.inf)
+        results=[None]*len(seeds)
+
+        if(self._n_jobs>1):
+            block=self._ds.share()
+            workers=min(self._n_jobs,len(seeds))
+            with ProcessPoolExecutor(workers,initializer=_attach_shared,
+                    initargs=block+(best,)) as pool:
+                futures={}
+                for i in range(len(seeds)):
+                    task=pool.submit(_restart_shared,self._k,options,seeds[i],
+                        maxstep,abandon)
+                    futures[task]=i
+                for task in as_completed(futures):
+                    results[futures[task]]=task.result()
+                    if(results[futures[task]][0] is not None):
+                        best.value=min(best.value,results[futures[task]][0])
+        else:
+            for i in range(len(seeds)):
+                results[i]=ClusterGroup._restart(self._ds,self._k,options,
+                    seeds[i],maxstep,abandon,best)
+                if(results[i][0] is not None):
+                    best.value=min(best.value,results[i][0])
+
+        self._restarts=[(seeds[i],results[i][0]) for i in range(len(seeds))]
+        pick=None
+        for i in range(len(results)):
+            if(results[i][0] is not None and
+                    (pick is None or results[i][0]<results[pick][0])):
+                pick=i
+        inertia,centroids,labels,trace=results[pick]
+        self._set_centroids(centroids)
+        self._kept=True
+        self._step_count=len(trace)
+        self._sums=None
+        self._counts=None
+        self._bound_labels=None
+        self._set_labels(labels)
+        return trace
+
+
+    def saveCheckpoint(self, path):
+        """Saves the state of this cluster group to the file path.
+
+        The file is a numpy .npz archive holding the centroids, the labels,
+        the running sums and counts of the clusters, the number of steps
+        done, the state of the random generator, the options the group
+        was made with, and the cluster tree of a 'hierarchical' group.  It
+        is written to a temporary file first and then
+        renamed, so a job stopped in the middle of saving leaves the
+        previous checkpoint intact.  The dataset itself is not saved.
+
+        Parameter path: the file to save to
+        Precondition: path is a string naming a writable file
+        """
+        assert type(path)==str
+
+        options=self._options()
+        options['seed']=self._seed
+        sums=numpy.array([x._sum for x in self._clusters])
+        counts=numpy.array([x._count for x in self._clusters])
+        tree={}
+        if(self._hierarchy is not None):
+            tree={'tree_centroids': self._hierarchy._centroids,
+                'tree_counts': self._hierarchy._counts,
+                'tree_parent': self._hierarchy._parent,
+                'tree_leaf': self._hierarchy._leaf}
+        temp=path+'.tmp'
+        with open(temp,'wb') as file:
+            numpy.savez(file,centroids=self._centroid_array(),
+                labels=self.getLabels(),sums=sums,counts=counts,
+                seen=self._seen,steps=numpy.int64(self._step_count),
+                size=numpy.array([self._ds.getSize(),self._ds.getDimension()],
+                    dtype=numpy.int64),
+                rng=numpy.array(json.dumps(self._rng.bit_generator.state)),
+                options=numpy.array(json.dumps(options)),kept=self._kept,
+                **tree)
+        os.replace(temp,path)
+
+
+    @classmethod
+    def loadCheckpoint(cls, ds, path):
+        """Returns: a new cluster group in the state saved in path.
+
+        The new group clusters ds, which must be the dataset the saved group
+        was clustering.  Running it continues exactly as the saved group
+        would have: it has the same centroids, clusters, options, step
+        count, random generator state and (for the 'hierarchical' engine)
+        cluster tree.  Note that maxstep in run counts new
+        steps, so to finish a job of maxstep steps, run the restored group
+        for maxstep-getStepCount() steps.
+
+        Parameter ds: the dataset the saved group was clustering
+        Precondition: ds is a Dataset with the same points as when the
+        checkpoint was saved
+
+        Parameter path: the checkpoint file
+        Precondition: path is a string naming a file written by
+        saveCheckpoint
+        """
+        assert isinstance(ds,Dataset)
+        assert type(path)==str
+
+        with numpy.load(path) as saved:
+            assert tuple(saved['size'])==(ds.getSize(),ds.getDimension())
+            options=json.loads(str(saved['options']))
+            centroids=saved['centroids']
+            k=len(centroids)
+            # seed_inds only skips the seeding; it does not go with n_init
+            n_init=options.pop('n_init')
+            group=cls(ds,k,list(range(k)),**options)
+            group._n_init=n_init
+            group._set_centroids(centroids)
+            group._labels=saved['labels'].astype(group._labels.dtype)
+            group._reset_sums(saved['sums'],saved['counts'])
+            group._seen=saved['seen'].copy()
+            group._step_count=int(saved['steps'])
+            group._kept=bool(saved['kept'])
+            if('tree_parent' in saved):
+                group._hierarchy=_ClusterTree(saved['tree_centroids'],
+                    saved['tree_counts'],saved['tree_parent'],
+                    saved['tree_leaf'])
+            group._rng.bit_generator.state=json.loads(str(saved['rng']))
+        return group
+
+
+    def getRestarts(self):
+        """Returns: A list with a pair (seed, inertia) for every restart of
+        the last run, in order.
+
+        inertia is None for a restart that was abandoned.  The list is empty
+        if the group does not do restarts or has not been run.
+        """
+        return list(self._restarts)
+
+
+    def getModel(self):
+        """Returns: a new ClusterModel holding a frozen copy of the current
+        centroids of this group.
+
+        The model does not refer to the group or its dataset, so it can
+        label new points while this group goes on changing.  The model of
+        a 'hierarchical' group labels points with a copy of its cluster
+        tree.
+        """
+        centroids=self._centroid_array()
+        tree=None
+        if(self._hierarchy is not None):
+            counts=numpy.array([x._count for x in self._clusters])
+            tree=self._hierarchy.refit(centroids,counts)
+        return ClusterModel(centroids,self._block_bytes,tree)
 
 
     # PROVIDED METHODS: Do not modify!
@@ -537,3 +4195,343 @@ class ClusterGroup(object):
     def __repr__(self):
         """Returns: Unambiguous representation of this cluster. """
         return str(self.__class__) + str(self)
+
+
+class ClusterJob(object):
+    """An instance is a run of a ClusterGroup on a worker thread.
+
+    A job is made by ClusterGroup.start() and starts at once.  After every
+    step the worker keeps a frozen copy of the centroids, which getCentroids
+    returns while the run goes on, and calls the progress function, if any,
+    with the dictionary of the step (its 'inertia' and 'reassigned' say how
+    far the run has got).  The progress function runs on the worker thread;
+    code on an asyncio loop should hand the dictionary over with
+    loop.call_soon_threadsafe.
+
+    Cancelling is cooperative: the worker checks for it between steps, so
+    the group is never left half way through a step, and it ends with the
+    clusters of the last step done.  The time-consuming numpy operations of
+    a step release the interpreter lock, so the thread that started the job
+    stays responsive.
+
+    A job is awaitable: `trace = await job` waits for the run without
+    blocking the event loop, and cancelling the awaiting task cancels the
+    job.  wait() does the same from ordinary code.
+
+    Instance Attributes:
+        _group: the group being run  [ClusterGroup]
+
+        _maxstep: the most steps the run does  [int >= 0]
+
+        _progress: the function called after every step
+            [function taking a dict, or None]
+
+        _checkpoint: the file the group is saved to, or None  [str, or None]
+
+        _every: the number of steps between checkpoints  [int > 0]
+
+        _centroids: the centroids after the last step done
+            [read-only 2D numpy array of float]
+
+        _steps: the number of steps done so far  [int >= 0]
+
+        _cancelled: set when the job is asked to stop  [threading.Event]
+
+        _future: the outcome of the run, holding the trace or the error
+            that ended it  [concurrent.futures.Future]
+
+        _thread: the worker thread  [threading.Thread]
+    """
+
+    def __init__(self, group, maxstep, progress=None, checkpoint=None,
+            every=10):
+        """Initializer: Creates a job running group and starts it.
+
+        Parameter group: the group to run
+        Precondition: group is a ClusterGroup made with n_init 1 that is
+        not used by anything else until the job is done
+
+        Parameter maxstep, progress, checkpoint, every: as in
+        ClusterGroup.start
+        """
+        assert isinstance(group,ClusterGroup) and group._n_init==1
+        assert type(maxstep)==int and maxstep >=0
+        assert progress is None or callable(progress)
+        assert checkpoint is None or type(checkpoint)==str
+        assert type(every)==int and every>0
+
+        self._group=group
+        self._maxstep=maxstep
+        self._progress=progress
+        self._checkpoint=checkpoint
+        self._every=every
+        self._centroids=self._snapshot()
+        self._steps=0
+        self._cancelled=threading.Event()
+        self._future=Future()
+        self._thread=threading.Thread(target=self._work,
+            name='ClusterJob')
+        self._thread.start()
+
+
+    def _snapshot(self):
+        """Returns: a read-only copy of the centroids of the group."""
+        centroids=self._group._centroid_array()
+        centroids.flags.writeable=False
+        return centroids
+
+
+    def _watch(self, record):
+        """Returns: True if the run should stop, after recording the step
+        described by record.
+
+        Parameter record: the dictionary of the step just done
+        Precondition: record is a dictionary as described in
+        ClusterGroup.run
+        """
+        self._centroids=self._snapshot()
+        self._steps=self._steps+1
+        if(self._progress is not None):
+            self._progress(record)
+        return self._cancelled.is_set()
+
+
+    def _work(self):
+        """Runs the group and records the outcome in _future.
+
+        This is the body of the worker thread.  An error raised by the run
+        (or by the progress function) ends the job and is raised again by
+        wait.
+        """
+        if(not self._future.set_running_or_notify_cancel()):
+            return
+        try:
+            trace=[]
+            if(not self._cancelled.is_set()):
+                trace=self._group._run_steps(self._maxstep,
+                    checkpoint=self._checkpoint,every=self._every,
+                    watch=self._watch)[0]
+                self._centroids=self._snapshot()
+            if(self._checkpoint is not None):
+                self._group.saveCheckpoint(self._checkpoint)
+        except BaseException as error:
+            self._future.set_exception(error)
+        else:
+            self._future.set_result(trace)
+
+
+    def getGroup(self):
+        """Returns: the group this job runs.
+
+        The group must not be used until the job is done.
+        """
+        return self._group
+
+
+    def getCentroids(self):
+        """Returns: a read-only 2D numpy array of the centroids after the
+        last step done, or the starting centroids if no step is done yet.
+
+        The array never changes; each step makes a new one.  It is safe to
+        call this from any thread while the job runs.
+        """
+        return self._centroids
+
+
+    def getStepCount(self):
+        """Returns: the number of steps this job has done so far."""
+        return self._steps
+
+
+    def cancel(self):
+        """Asks the job to stop after the step it is doing.
+
+        The call does not wait; use wait (or await the job) for the run to
+        actually end.  Its trace then describes the steps done.  Cancelling
+        a job that is done does nothing.
+        """
+        self._cancelled.set()
+
+
+    def isCancelled(self):
+        """Returns: True if cancel has been called on this job."""
+        return self._cancelled.is_set()
+
+
+    def isDone(self):
+        """Returns: True if the run has ended, normally, by cancelling or
+        by an error.
+        """
+        return self._future.done()
+
+
+    def wait(self, timeout=None):
+        """Returns: the trace of the run, as described in
+        ClusterGroup.run, after waiting for it to end.
+
+        If the run ended with an error, that error is raised here.  If
+        timeout seconds pass first, concurrent.futures.TimeoutError is
+        raised and the job goes on.
+
+        Parameter timeout: the most seconds to wait (optional)
+        Precondition: timeout is None (to wait for as long as it takes) or
+        a number >= 0
+        """
+        assert timeout is None or (type(timeout) in [int,float] and timeout>=0)
+        return self._future.result(timeout)
+
+
+    def __await__(self):
+        """Returns: an iterator that makes `await job` give the trace of
+        the run, as wait() does, without blocking the event loop.
+
+        Cancelling the task that awaits the job cancels the job (see
+        cancel), so the run stops after the step it is doing.
+        """
+        return self._await().__await__()
+
+
+    async def _await(self):
+        """Returns: the trace of the run, once it ends, for __await__.
+
+        An asyncio.CancelledError while waiting calls cancel before it is
+        raised again.  Cancelling the wrapped future alone would do
+        nothing, since the run is already going.
+        """
+        try:
+            return await asyncio.wrap_future(self._future)
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+
+
+    def __str__(self):
+        """Returns: String representation of the state of this job."""
+        state='running'
+        if(self.isDone()):
+            state='done'
+        elif(self.isCancelled()):
+            state='cancelling'
+        return state+' after '+str(self._steps)+' steps'
+
+
+    def __repr__(self):
+        """Returns: Unambiguous representation of this job. """
+        return str(self.__class__) + str(self)
+
+
+class ClusterModel(object):
+    """An instance is a trained k-means model: the frozen centroids of a
+    ClusterGroup, used to label new points.
+
+    A model is made by ClusterGroup.getModel() and never changes
+    afterwards; its arrays are read-only.  Labeling a batch of points is
+    one vectorized call, with no per-point checks and no Cluster objects,
+    so it suits a latency-sensitive request path.
+
+    Instance Attributes:
+        _centroids: the centroids; row j is the centroid of cluster j
+            [read-only 2D numpy array of float]
+
+        _norms: the squared length of each centroid
+            [read-only 1D numpy array of float]
+
+        _block_bytes: about how many bytes the points-by-centroids
+            distances of predict may take at once  [int > 0]
+
+        _tree: the cluster tree predict walks down, or None to measure
+            every point against every centroid  [_ClusterTree, or None]
+    """
+
+    def __init__(self, centroids, block_bytes=BLOCK_BYTES, tree=None):
+        """Initializer: Creates a model with a COPY of the given centroids.
+
+        Parameter centroids: the centroids
+        Precondition: centroids is a nonempty 2D list of numbers or 2D
+        numpy array with at least one column
+
+        Parameter block_bytes: the memory ceiling of a block (optional)
+        Precondition: block_bytes is an int > 0
+
+        Parameter tree: the cluster tree (optional)
+        Precondition: tree is None or a _ClusterTree whose leaves have the
+        given centroids; it is not copied, so it must not be shared with
+        code that changes it
+        """
+        centroids=numpy.array(centroids,dtype=numpy.float64,order='C')
+        assert centroids.ndim==2 and centroids.size>0
+        assert type(block_bytes)==int and block_bytes>0
+
+        norms=_sq_norms(centroids)
+        centroids.flags.writeable=False
+        norms.flags.writeable=False
+        self._centroids=centroids
+        self._norms=norms
+        self._block_bytes=block_bytes
+        self._tree=tree
+
+
+    def getK(self):
+        """Returns: the number of clusters of this model."""
+        return len(self._centroids)
+
+
+    def getDimension(self):
+        """Returns: the point dimension of this model."""
+        return self._centroids.shape[1]
+
+
+    def getCentroids(self):
+        """Returns: the read-only 2D numpy array of the centroids of this
+        model, row j being the centroid of cluster j.
+        """
+        return self._centroids
+
+
+    def predict(self, points):
+        """Returns: a 1D numpy array with the label of the nearest centroid
+        of each of the given points.
+
+        The distances are |x|^2 - 2x.c + |c|^2 with the cached |c|^2, and
+        ties go to the lower label, exactly as in a 'lloyd' partition.  A
+        batch whose distances fit in the memory ceiling is labeled with one
+        matrix product; a bigger one is labeled a block at a time.  A model
+        with a cluster tree instead walks each point down the tree, as a
+        'hierarchical' partition does.  Like a partition, this is only
+        accurate for data reasonably near the origin (see
+        ClusterGroup.getInertia).
+
+        Parameter points: the points to label
+        Precondition: points is a 2D numpy array of floats or 2D list of
+        numbers with getDimension() columns
+        """
+        points=numpy.asarray(points)
+        if(points.dtype.kind!='f'):
+            points=points.astype(numpy.float64)
+        assert points.ndim==2 and points.shape[1]==self.getDimension()
+
+        if(self._tree is not None):
+            return self._tree.descend(points,self._block_bytes)[0]
+
+        k=self.getK()
+        labels=numpy.empty(len(points),dtype=numpy.intp)
+        rows=_block_rows(self.getDimension(),k,self._block_bytes)
+        for start in range(0,len(points),rows):
+            block=points[start:start+rows]
+            dist=block@self._centroids.T
+            dist*=-2.0
+            dist+=_sq_norms(block)[:,None]
+            dist+=self._norms
+            numpy.maximum(dist,0.0,out=dist)
+            labels[start:start+len(block)]=numpy.argmin(dist,axis=1)
+        return labels
+
+
+    def __str__(self):
+        """Returns: String representation of the centroids of this model."""
+        return str(self._centroids.tolist())
+
+
+    def __repr__(self):
+        """Returns: Unambiguous representation of this model."""
+        return str(self.__class__) + str(self)
@@ -0,0 +1,191 @@
+# Benchmarks for the k-means clustering module
+"""Benchmark harness for clustering.py
+
+This script times the clustering module on synthetic datasets of Gaussian
+blobs, over a grid of sizes n (points), d (dimension) and k (clusters).
+For every case it separately times building the Dataset, making the
+ClusterGroup, one _partition, one _update and a full run, and records the
+peak memory allocated during each phase.  It then labels batches of
+PREDICT_BATCH new points with the trained model (ClusterGroup.getModel)
+and records the median and 99th percentile latency of predict.  Each
+case is written as one line of JSON, so results of different runs (or
+different engines) can be compared with any tool that reads JSON.
+
+Run it from this folder, for example
+
+    python clustering_bench.py --n 10000 100000 --d 2 16 --k 8 64 --out a.jsonl
+
+With no options it runs the full grid (n up to 10**7, d from 2 to 512, k
+from 2 to 4096), skipping cases whose points would not fit in --max-bytes.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy
+import clustering
+
+
+# The full grid of sizes
+GRID_N = [10**3, 10**4, 10**5, 10**6, 10**7]
+GRID_D = [2, 8, 32, 128, 512]
+GRID_K = [2, 16, 128, 1024, 4096]
+
+# The number of points in a timed predict batch
+PREDICT_BATCH = 1000
+
+
+def make_blobs(n, d, k, seed):
+    """Returns: a 2D numpy array of n points in d dimensions, drawn from k
+    Gaussian blobs of standard deviation 1 with centers spread over a cube.
+
+    Parameter n: the number of points
+    Precondition: n is an int > 0
+
+    Parameter d: the dimension
+    Precondition: d is an int > 0
+
+    Parameter k: the number of blobs
+    Precondition: k is an int > 0
+
+    Parameter seed: the seed of the random numbers
+    Precondition: seed is an int >= 0
+    """
+    rng=numpy.random.default_rng(seed)
+    centers=rng.uniform(-10.0*k**(1.0/d),10.0*k**(1.0/d),size=(k,d))
+    points=rng.standard_normal((n,d))
+    points+=centers[rng.integers(0,k,n)]
+    return points
+
+
+def measure(function):
+    """Returns: a tuple (result, seconds, peak) for calling function().
+
+    peak is the largest number of bytes allocated at once (as seen by
+    tracemalloc) during the call, above what was allocated before it.
+
+    Parameter function: the function to time
+    Precondition: function is a function of no arguments
+    """
+    base=tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    start=time.perf_counter()
+    result=function()
+    seconds=time.perf_counter()-start
+    peak=tracemalloc.get_traced_memory()[1]-base
+    return (result,seconds,peak)
+
+
+def latencies(function, repeats):
+    """Returns: a 1D numpy array of the seconds taken by each of repeats
+    calls of function(), after one untimed call to warm up.
+
+    Parameter function: the function to time
+    Precondition: function is a function of no arguments
+
+    Parameter repeats: the number of timed calls
+    Precondition: repeats is an int > 0
+    """
+    function()
+    result=numpy.empty(repeats)
+    for i in range(repeats):
+        start=time.perf_counter()
+        function()
+        result[i]=time.perf_counter()-start
+    return result
+
+
+def run_case(n, d, k, engine, maxstep, seed, repeats=100):
+    """Returns: a dictionary with the timings and peak memory of one case.
+
+    Parameter n, d, k: the size of the case
+    Precondition: n, d, k are ints > 0 with k <= n
+
+    Parameter engine: the ClusterGroup engine to use
+    Precondition: engine is one of the strings in clustering.ENGINES
+
+    Parameter maxstep: the maxstep of the timed run
+    Precondition: maxstep is an int >= 0
+
+    Parameter seed: the seed of the data and of the cluster groups
+    Precondition: seed is an int >= 0
+
+    Parameter repeats: the number of timed predict batches (optional)
+    Precondition: repeats is an int > 0
+    """
+    points=make_blobs(n,d,k,seed)
+    result={'n': n, 'd': d, 'k': k, 'engine': engine, 'seed': seed}
+
+    ds,result['dataset_time'],result['dataset_peak']=measure(
+        lambda: clustering.Dataset(d,points))
+    del points
+
+    group,result['init_time'],result['init_peak']=measure(
+        lambda: clustering.ClusterGroup(ds,k,engine=engine,seed=seed))
+    if(engine!='minibatch'):
+        x,result['partition_time'],result['partition_peak']=measure(
+            group._partition)
+        x,result['update_time'],result['update_peak']=measure(group._update)
+
+    group=clustering.ClusterGroup(ds,k,engine=engine,seed=seed)
+    trace,result['run_time'],result['run_peak']=measure(
+        lambda: group.run(maxstep))
+    result['run_steps']=len(trace)
+    result['inertia']=group.getInertia()
+    model=group.getModel()
+    group.close()
+
+    batch=make_blobs(PREDICT_BATCH,d,k,seed+1)
+    times=latencies(lambda: model.predict(batch),repeats)
+    result['predict_batch']=PREDICT_BATCH
+    result['predict_p50']=float(numpy.percentile(times,50))
+    result['predict_p99']=float(numpy.percentile(times,99))
+    return result
+
+
+def main(argv=None):
+    """Runs the benchmark grid given by the command line arguments argv
+    (sys.argv[1:] if argv is None) and writes the results.
+    """
+    parser=argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--n',type=int,nargs='+',default=GRID_N)
+    parser.add_argument('--d',type=int,nargs='+',default=GRID_D)
+    parser.add_argument('--k',type=int,nargs='+',default=GRID_K)
+    parser.add_argument('--engine',nargs='+',default=['lloyd'],
+        choices=clustering.ENGINES)
+    parser.add_argument('--maxstep',type=int,default=10)
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--predict-repeats',type=int,default=100,
+        help='number of timed predict batches per case')
+    parser.add_argument('--max-bytes',type=float,default=4e9,
+        help='skip cases whose points take more bytes than this')
+    parser.add_argument('--out',default='-',
+        help='file to append JSON lines to (- for standard output)')
+    args=parser.parse_args(argv)
+
+    out=sys.stdout if args.out=='-' else open(args.out,'a')
+    stamp={'python': platform.python_version(), 'numpy': numpy.__version__,
+        'machine': platform.machine(), 'time': time.time()}
+    tracemalloc.start()
+    try:
+        for n in args.n:
+            for d in args.d:
+                for k in args.k:
+                    if(k>n or 8.0*n*d>args.max_bytes):
+                        continue
+                    for engine in args.engine:
+                        result=run_case(n,d,k,engine,args.maxstep,args.seed,
+                            args.predict_repeats)
+                        result.update(stamp)
+                        out.write(json.dumps(result)+'\n')
+                        out.flush()
+    finally:
+        tracemalloc.stop()
+        if(out is not sys.stdout):
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,627 @@
+# Tests for the k-means clustering module
+"""Tests for clustering.py
+
+Each test checks a guarantee made by the documentation of clustering.py
+on small synthetic datasets.  Run them from this folder with
+
+    python -m pytest test_clustering.py
+"""
+import asyncio
+import threading
+import time
+import numpy
+import pytest
+import clustering
+import clustering_bench
+
+
+def make_blobs(n, d, k, seed):
+    """Returns: a 2D numpy array of n points in d dimensions, drawn from k
+    Gaussian blobs of standard deviation 1 with centers spread over a cube.
+
+    Parameter n, d, k: the number of points, the dimension and the number
+    of blobs
+    Precondition: n, d, k are ints > 0
+
+    Parameter seed: the seed of the random numbers
+    Precondition: seed is an int >= 0
+    """
+    rng=numpy.random.default_rng(seed)
+    centers=rng.uniform(-10.0,10.0,size=(k,d))
+    return centers[rng.integers(0,k,n)]+rng.standard_normal((n,d))
+
+
+@pytest.mark.parametrize('engine',clustering.ENGINES)
+def test_checkpoint_resumes_exactly(engine, tmp_path):
+    """A group restored from a checkpoint continues exactly as the saved
+    group does."""
+    ds=clustering.Dataset(3,make_blobs(600,3,6,0))
+    path=str(tmp_path/'group.npz')
+    group=clustering.ClusterGroup(ds,6,engine=engine,seed=1,batch_size=64)
+    group.run(3)
+    group.saveCheckpoint(path)
+    resumed=clustering.ClusterGroup.loadCheckpoint(ds,path)
+    assert resumed.getStepCount()==group.getStepCount()
+    group.run(5)
+    resumed.run(5)
+    assert numpy.array_equal(resumed._centroid_array(),group._centroid_array())
+    assert numpy.array_equal(resumed.getLabels(),group.getLabels())
+
+
+def test_checkpoint_after_restarts(tmp_path):
+    """The checkpoint written at the end of a run with restarts can be
+    loaded, and keeps the chosen centroids and the number of restarts."""
+    ds=clustering.Dataset(2,make_blobs(500,2,5,2))
+    path=str(tmp_path/'group.npz')
+    group=clustering.ClusterGroup(ds,5,seed=3,n_init=3)
+    group.run(10,checkpoint=path)
+    resumed=clustering.ClusterGroup.loadCheckpoint(ds,path)
+    assert resumed._n_init==3
+    assert resumed.getStepCount()==group.getStepCount()>0
+    assert numpy.array_equal(resumed._centroid_array(),group._centroid_array())
+    assert resumed.getInertia()==pytest.approx(group.getInertia())
+
+
+def nearest(points, centroids):
+    """Returns: the index of the nearest centroid of every point, found by
+    brute force.
+
+    Parameter points, centroids: the points and centroids
+    Precondition: they are 2D numpy arrays with the same number of columns
+    """
+    diff=points[:,None,:]-centroids[None,:,:]
+    return numpy.argmin((diff*diff).sum(axis=2),axis=1)
+
+
+def cost(points, centroids, weights=None):
+    """Returns: the (weighted) sum of squared distances from every point to
+    its nearest centroid.
+
+    Parameter points, centroids: the points and centroids
+    Precondition: they are 2D numpy arrays with the same number of columns
+
+    Parameter weights: the weight of each point (optional)
+    Precondition: weights is None or a 1D numpy array, one per point
+    """
+    diff=points-centroids[nearest(points,centroids)]
+    sq=(diff*diff).sum(axis=1)
+    return float(sq.sum() if weights is None else sq@weights)
+
+
+# user-001
+def test_dataset_copies_points():
+    """Points are copied into the buffer and read back unchanged."""
+    ds=clustering.Dataset(2)
+    point=[1.0,2.0]
+    for i in range(100):
+        ds.addPoint([float(i),-float(i)])
+    ds.addPoint(point)
+    point[0]=5.0
+    assert ds.getSize()==101
+    assert ds.getPoint(100)==[1.0,2.0]
+    assert ds.getContents()[7]==[7.0,-7.0]
+    contents=ds.getContents()
+    contents[0][0]=9.0
+    assert ds.getPoint(0)==[0.0,0.0]
+    with pytest.raises(ValueError):
+        ds.getArray()[0,0]=9.0
+
+
+# user-002
+def test_partition_is_nearest_centroid():
+    """A partition puts every point in the cluster of its nearest
+    centroid."""
+    points=make_blobs(500,3,5,4)
+    group=clustering.ClusterGroup(clustering.Dataset(3,points),5,seed=0)
+    group.step()
+    before=group._centroid_array()
+    group._partition()
+    assert numpy.array_equal(group.getLabels(),nearest(points,before))
+
+
+def test_add_indices_skips_repeats():
+    """addIndices never stores an index twice in a cluster."""
+    ds=clustering.Dataset(1,[[0.0],[1.0],[2.0],[3.0]])
+    cluster=clustering.Cluster(ds,[0.0])
+    cluster.addIndices([3,1,3,2])
+    cluster.addIndices([2,0,0])
+    assert cluster.getIndices()==[3,1,2,0]
+    cluster.updateCentroid()
+    assert cluster.getCentroid()==[1.5]
+
+
+# user-003
+def steps_like_lloyd(options):
+    """Checks that a group made with the given options labels every point
+    as a plain 'lloyd' group does, step after step.
+
+    Parameter options: the keyword arguments of the group
+    Precondition: options is a dictionary of ClusterGroup options
+    """
+    ds=clustering.Dataset(4,make_blobs(2000,4,12,5))
+    plain=clustering.ClusterGroup(ds,12,seed=6)
+    group=clustering.ClusterGroup(ds,12,seed=6,**options)
+    for i in range(8):
+        plain.step()
+        group.step()
+        assert numpy.array_equal(group.getLabels(),plain.getLabels())
+        assert numpy.allclose(group._centroid_array(),plain._centroid_array())
+    group.close()
+    assert all(x>=0 for x in group.getSkippedCounts())
+
+
+@pytest.mark.parametrize('block_bytes',[clustering.BLOCK_BYTES,4096])
+def test_hamerly_matches_lloyd(block_bytes):
+    """The 'hamerly' engine labels points as 'lloyd' does."""
+    steps_like_lloyd({'engine': 'hamerly', 'block_bytes': block_bytes})
+
+
+def test_hamerly_is_bit_identical():
+    """The 'hamerly' engine gives exactly the centroids of 'lloyd'."""
+    ds=clustering.Dataset(5,make_blobs(3000,5,20,7))
+    plain=clustering.ClusterGroup(ds,20,seed=8)
+    group=clustering.ClusterGroup(ds,20,seed=8,engine='hamerly')
+    plain.run(20)
+    group.run(20)
+    assert numpy.array_equal(group._centroid_array(),plain._centroid_array())
+    assert sum(group.getSkippedCounts())>0
+
+
+# user-004
+def test_kdtree_matches_lloyd():
+    """The 'kdtree' engine labels points as 'lloyd' does."""
+    steps_like_lloyd({'engine': 'kdtree'})
+
+
+# user-005
+def test_partial_fit_keeps_the_running_mean():
+    """With one cluster, partialFit keeps the centroid at the mean of all
+    the points learned, without storing them."""
+    ds=clustering.Dataset(2,[[0.0,0.0]])
+    group=clustering.ClusterGroup(ds,1,seed=0,engine='minibatch')
+    chunks=[make_blobs(50,2,1,i) for i in range(4)]
+    for chunk in chunks:
+        group.partialFit(chunk)
+    assert ds.getSize()==1
+    mean=numpy.concatenate(chunks).mean(axis=0)
+    assert numpy.allclose(group._centroid_array()[0],mean)
+
+
+def test_minibatch_clusters():
+    """A 'minibatch' run ends with every point in a cluster and an inertia
+    close to that of 'lloyd'."""
+    ds=clustering.Dataset(2,make_blobs(2000,2,4,9))
+    group=clustering.ClusterGroup(ds,4,seed=1,engine='minibatch',
+        init='k-means++',batch_size=256)
+    group.run(30)
+    plain=clustering.ClusterGroup(ds,4,seed=1,init='k-means++')
+    plain.run(30)
+    assert numpy.all(numpy.asarray(group.getLabels())<4)
+    assert group.getInertia()<1.1*plain.getInertia()
+
+
+# user-006
+@pytest.mark.parametrize('init',['k-means++','k-means||'])
+def test_seeding(init):
+    """Seeding picks k distinct points, the same ones for the same seed and
+    whatever the block size."""
+    points=make_blobs(3000,3,30,10)
+    ds=clustering.Dataset(3,points)
+    first=clustering.ClusterGroup(ds,30,init=init,seed=2)._centroid_array()
+    again=clustering.ClusterGroup(ds,30,init=init,seed=2,
+        block_bytes=2048)._centroid_array()
+    assert numpy.array_equal(first,again)
+    assert len(numpy.unique(first,axis=0))==30
+    assert all(any(numpy.array_equal(c,p) for p in points) for c in first)
+
+
+# user-007
+def test_parallel_matches_lloyd():
+    """The partition split across worker processes labels points as the
+    one in this process does."""
+    steps_like_lloyd({'n_jobs': 2})
+
+
+# user-008
+def test_mapped_files(tmp_path):
+    """A dataset mapped from a .npy or raw file has the points of the file
+    and clusters like one held in memory."""
+    points=make_blobs(400,3,4,11)
+    numpy.save(str(tmp_path/'points.npy'),points)
+    points.astype('<f4').tofile(str(tmp_path/'points.raw'))
+    mapped=clustering.Dataset.fromFile(str(tmp_path/'points.npy'))
+    raw=clustering.Dataset.fromFile(str(tmp_path/'points.raw'),3,
+        numpy.float32)
+    assert mapped.isMapped() and raw.isMapped()
+    assert numpy.array_equal(mapped.getArray(),points)
+    assert numpy.array_equal(raw.getArray(),points.astype(numpy.float32))
+    group=clustering.ClusterGroup(mapped,4,seed=3)
+    plain=clustering.ClusterGroup(clustering.Dataset(3,points),4,seed=3)
+    group.run(10)
+    plain.run(10)
+    assert numpy.array_equal(group.getLabels(),plain.getLabels())
+    with pytest.raises(AssertionError):
+        mapped.addPoint([0.0,0.0,0.0])
+
+
+# user-009
+def test_text_loader(tmp_path):
+    """fromText reads the same points as numpy.loadtxt, chunk by chunk,
+    skipping comments and blank lines."""
+    points=numpy.round(make_blobs(250,3,3,12),3)
+    path=tmp_path/'points.csv'
+    lines=['x,y,z','# a comment']+[','.join(map(str,p)) for p in points]
+    lines.insert(100,'')
+    path.write_text('\n'.join(lines)+'\n')
+    seen=[]
+    ds=clustering.Dataset.fromText(str(path),skip=1,chunk_rows=64,
+        progress=lambda rows, rate: seen.append(rows))
+    assert numpy.array_equal(ds.getArray(),points)
+    assert seen[-1]==250 and len(seen)>1
+
+
+# user-010
+def test_labels():
+    """The clusters of a group are read from its labels, and a point is
+    in at most one cluster."""
+    ds=clustering.Dataset(2,make_blobs(600,2,3,13))
+    group=clustering.ClusterGroup(ds,3,seed=4)
+    group.run(5)
+    labels=numpy.array(group.getLabels())
+    clusters=group.getClusters()
+    assert not group.getLabels().flags.writeable
+    i=clusters[1].getIndices()[0]
+    clusters[0].addIndex(i)
+    assert i in clusters[0].getIndices()
+    assert i not in clusters[1].getIndices()
+    labels[i]=0
+    for j in range(3):
+        assert clusters[j].getIndices()==numpy.flatnonzero(labels==j).tolist()
+
+
+# user-011
+def test_running_sums():
+    """The running sums of the clusters match their points as points move
+    between clusters."""
+    points=make_blobs(600,2,3,13)
+    group=clustering.ClusterGroup(clustering.Dataset(2,points),3,seed=4)
+    group.run(5)
+    clusters=group.getClusters()
+    clusters[0].addIndices(clusters[1].getIndices()[:10])
+    labels=numpy.asarray(group.getLabels())
+    for j in range(3):
+        members=numpy.flatnonzero(labels==j)
+        assert numpy.allclose(clusters[j]._sum,points[members].sum(axis=0))
+        assert clusters[j]._count==len(members)
+    clusters[2].updateCentroid()
+    assert numpy.allclose(clusters[2].getCentroid(),
+        points[labels==2].mean(axis=0))
+
+
+# user-012
+def test_run_trace():
+    """run returns one record per step, ending with a converged step."""
+    ds=clustering.Dataset(2,make_blobs(500,2,4,14))
+    group=clustering.ClusterGroup(ds,4,seed=5)
+    trace=group.run(50)
+    assert 0<len(trace)<50
+    assert trace[-1]['converged'] or trace[-1]['reassigned']==0
+    assert set(trace[0])=={'partition_time','update_time','inertia',
+        'reassigned','shift','converged'}
+    assert trace[-1]['inertia']==group.getInertia()
+
+
+@pytest.mark.parametrize('offset',[0.0,1e4,1e6])
+def test_inertia_far_from_origin(offset):
+    """The inertia is accurate however far the data is from the origin."""
+    rng=numpy.random.default_rng(15)
+    points=rng.standard_normal((2000,2))*0.1+offset
+    group=clustering.ClusterGroup(clustering.Dataset(2,points),3,seed=0)
+    group.run(10)
+    centroids=group._centroid_array()
+    diff=points-centroids[numpy.asarray(group.getLabels())]
+    assert group.getInertia()==pytest.approx(float((diff*diff).sum()),
+        rel=1e-9)
+
+
+# user-013
+def test_restarts_keep_the_best():
+    """A run with restarts keeps the restart with the lowest inertia, and
+    is reproducible from its seed."""
+    ds=clustering.Dataset(2,make_blobs(800,2,8,16))
+    group=clustering.ClusterGroup(ds,8,seed=7,n_init=4)
+    trace=group.run(20)
+    inertias=[x[1] for x in group.getRestarts()]
+    assert len(inertias)==4
+    assert group.getStepCount()==len(trace)
+    assert group.getInertia()==pytest.approx(min(inertias))
+    again=clustering.ClusterGroup(ds,8,seed=7,n_init=4)
+    again.run(20)
+    assert numpy.array_equal(again._centroid_array(),group._centroid_array())
+
+
+# user-015
+def test_benchmark_case():
+    """The benchmark times every phase of a small case."""
+    result=clustering_bench.run_case(300,2,3,'lloyd',5,0,repeats=3)
+    for key in ['dataset_time','partition_time','run_time','inertia',
+            'predict_p50','predict_p99']:
+        assert key in result
+
+
+# user-016
+def test_approx_engine():
+    """The 'approx' engine records its inertia gaps and ends near the
+    inertia of 'lloyd'."""
+    ds=clustering.Dataset(16,make_blobs(3000,16,40,17))
+    group=clustering.ClusterGroup(ds,40,seed=8,engine='approx',
+        init='k-means++')
+    plain=clustering.ClusterGroup(ds,40,seed=8,init='k-means++')
+    group.run(15)
+    plain.run(15)
+    assert len(group.getInertiaGaps())==group.getStepCount()
+    assert group.getInertia()<1.05*plain.getInertia()
+
+
+# user-017
+def test_sparse_matches_dense():
+    """A SparseDataset clusters exactly like the dense dataset of the same
+    points, and round-trips through CSR."""
+    rng=numpy.random.default_rng(18)
+    points=rng.standard_normal((500,40))*(rng.random((500,40))<0.1)
+    dense=clustering.Dataset(40,points)
+    sparse=clustering.SparseDataset(40,points)
+    assert sparse.getNnz()==numpy.count_nonzero(points)
+    copy=clustering.SparseDataset.fromCSR(40,*sparse.getCSR())
+    assert copy.getContents()==dense.getContents()
+    first=clustering.ClusterGroup(dense,5,seed=9)
+    second=clustering.ClusterGroup(sparse,5,seed=9)
+    first.run(10)
+    second.run(10)
+    assert numpy.array_equal(first.getLabels(),second.getLabels())
+    assert numpy.allclose(first._centroid_array(),second._centroid_array())
+    assert second.getInertia()==pytest.approx(first.getInertia())
+
+
+def test_sparse_has_no_dense_file(tmp_path):
+    """A SparseDataset cannot be mapped from a dense file."""
+    numpy.save(str(tmp_path/'points.npy'),make_blobs(20,3,2,31))
+    with pytest.raises(AssertionError):
+        clustering.SparseDataset.fromFile(str(tmp_path/'points.npy'))
+
+
+# user-018
+def test_blocked_matches_lloyd():
+    """A small block_bytes does not change the labels of 'lloyd'."""
+    steps_like_lloyd({'block_bytes': 4096})
+
+
+def test_norm_cache():
+    """The cached squared lengths follow the points added."""
+    ds=clustering.Dataset(3,make_blobs(10,3,2,19))
+    ds.getNorms()
+    ds.addPoints(make_blobs(5,3,2,20))
+    ds.addPoint([1.0,2.0,2.0])
+    array=ds.getArray()
+    assert numpy.allclose(ds.getNorms(),(array*array).sum(axis=1))
+    assert ds.getNorms()[-1]==9.0
+
+
+# user-019
+def test_model_predict():
+    """A model labels points with their nearest centroid, and does not
+    change when its group does."""
+    points=make_blobs(600,3,5,21)
+    group=clustering.ClusterGroup(clustering.Dataset(3,points),5,seed=10)
+    assert group.run(100)[-1]['reassigned']==0
+    model=group.getModel()
+    assert numpy.array_equal(model.predict(points),group.getLabels())
+    fresh=make_blobs(50,3,5,22)
+    assert numpy.array_equal(model.predict(fresh),
+        nearest(fresh,model.getCentroids()))
+    centroids=model.getCentroids().copy()
+    group.getClusters()[0].setCentroid([0.0,0.0,0.0])
+    assert numpy.array_equal(model.getCentroids(),centroids)
+
+
+# user-020
+def test_online_learning():
+    """Online learning puts each added point in its nearest cluster and
+    keeps every centroid the mean of its points."""
+    ds=clustering.Dataset(2,make_blobs(300,2,3,23))
+    group=clustering.ClusterGroup(ds,3,seed=11)
+    group.run(10)
+    group.setOnline(True)
+    centroids=group._centroid_array()
+    for point in make_blobs(20,2,3,24):
+        ds.addPoint(point.tolist())
+    ds.addPoints(make_blobs(30,2,3,25))
+    labels=numpy.asarray(group.getLabels())
+    assert numpy.all(labels<3)
+    assert labels[300]==nearest(ds.getArray()[300:301],centroids)[0]
+    array=ds.getArray()
+    for j in range(3):
+        mean=array[labels==j].mean(axis=0)
+        assert numpy.allclose(group.getClusters()[j].getCentroid(),mean)
+
+
+# user-021
+def test_hierarchy_is_built_over_the_points(monkeypatch):
+    """A 'hierarchical' run builds its cluster tree over the points, and
+    its model labels points with the tree."""
+    sizes=[]
+    build=clustering._build_hierarchy
+    def spy(points, *args, **kwargs):
+        sizes.append(len(points))
+        return build(points,*args,**kwargs)
+    monkeypatch.setattr(clustering,'_build_hierarchy',spy)
+    points=make_blobs(3000,4,64,26)
+    group=clustering.ClusterGroup(clustering.Dataset(4,points),64,seed=12,
+        engine='hierarchical')
+    group.run(10)
+    assert sizes==[3000]
+    plain=clustering.ClusterGroup(clustering.Dataset(4,points),64,seed=12,
+        init='k-means++')
+    plain.run(10)
+    assert group.getInertia()<1.2*plain.getInertia()
+    assert len(group.getModel().predict(points))==3000
+
+
+# user-022
+def test_coreset():
+    """A coreset is a small weighted dataset on which centroids cost
+    about what they cost on the full data."""
+    points=make_blobs(20000,2,5,27)
+    ds=clustering.Dataset(2,points)
+    summary=ds.getCoreset(500,seed=0,chunk_rows=4096)
+    assert summary.getSize()<=500 and summary.isWeighted()
+    assert summary.getTotalWeight()==pytest.approx(20000,rel=0.1)
+    small=clustering.ClusterGroup(summary,5,seed=13,init='k-means++')
+    small.run(30)
+    full=clustering.ClusterGroup(ds,5,seed=13,init='k-means++')
+    full.run(30)
+    for centroids in [small._centroid_array(),full._centroid_array()]:
+        assert cost(summary.getArray(),centroids,summary.getWeights())== \
+            pytest.approx(cost(points,centroids),rel=0.1)
+    with pytest.raises(AssertionError):
+        clustering.ClusterGroup(summary,5,engine='hierarchical')
+    sparse=clustering.SparseDataset(2,points[:100])
+    with pytest.raises(AssertionError):
+        sparse.getCoreset(10)
+
+
+@pytest.mark.parametrize('init',['k-means++','k-means||'])
+def test_weighted_seeding(init):
+    """Seeding a weighted dataset favors heavy points."""
+    points=make_blobs(500,2,1,32)
+    weights=numpy.ones(500)
+    weights[7]=1e6
+    ds=clustering.Dataset(2,points,weights=weights)
+    for seed in range(10):
+        group=clustering.ClusterGroup(ds,3,init=init,seed=seed)
+        assert any(numpy.array_equal(c,points[7])
+            for c in group._centroid_array())
+
+
+# user-023
+def test_weights_count_as_copies():
+    """A point of weight w clusters like w copies of the point."""
+    rng=numpy.random.default_rng(28)
+    points=make_blobs(200,2,3,28)
+    weights=rng.integers(1,4,200)
+    weighted=clustering.Dataset(2,points,weights=weights.astype(float))
+    expanded=clustering.Dataset(2,numpy.repeat(points,weights,axis=0))
+    seeds=list(range(3))
+    first=clustering.ClusterGroup(weighted,3,seeds)
+    second=clustering.ClusterGroup(expanded,3,
+        [int(x) for x in numpy.cumsum(weights)[:3]-weights[:3]])
+    first.run(20)
+    second.run(20)
+    assert numpy.allclose(first._centroid_array(),second._centroid_array())
+    assert first.getInertia()==pytest.approx(second.getInertia())
+
+
+def test_dedup():
+    """A dedup dataset stores each distinct point once, with a weight, and
+    treats -0.0 as 0.0."""
+    ds=clustering.Dataset(2,dedup=True)
+    ds.addPoint([0.0,1.0])
+    ds.addPoint([-0.0,1.0])
+    ds.addPoints([[2.0,3.0],[0.0,1.0],[2.0,3.0]],[1.0,2.0,0.5])
+    assert ds.isDedup() and ds.getSize()==2
+    assert ds.getContents()==[[0.0,1.0],[2.0,3.0]]
+    assert ds.getWeights().tolist()==[4.0,1.5]
+
+
+@pytest.mark.parametrize('options',[{'engine': 'kdtree'},{'n_jobs': 2},
+    {'engine': 'hierarchical'}])
+def test_weights_need_a_weighted_engine(options):
+    """A dataset cannot become weighted under a group that ignores
+    weights."""
+    ds=clustering.Dataset(1,[[0.0],[1.0],[10.0],[11.0]])
+    group=clustering.ClusterGroup(ds,2,[0,2],**options)
+    with pytest.raises(AssertionError):
+        ds.addPoint([0.0],100.0)
+    assert ds.getSize()==4 and not ds.isWeighted()
+    ds.addPoints([[0.5]],[1.0])
+    group.close()
+
+
+def test_sparse_is_never_weighted(tmp_path):
+    """A SparseDataset rejects weights and dedup mode with an assertion,
+    and accepts the default values."""
+    path=tmp_path/'points.csv'
+    path.write_text('0,1\n0,1\n')
+    with pytest.raises(AssertionError):
+        clustering.SparseDataset.fromText(str(path),dedup=True)
+    ds=clustering.SparseDataset.fromText(str(path))
+    ds.addPoint([2.0,0.0],1)
+    ds.addPoints([[0.0,3.0]],None)
+    assert ds.getSize()==4 and not ds.isWeighted()
+    with pytest.raises(AssertionError):
+        ds.addPoint([1.0,0.0],2.0)
+    with pytest.raises(AssertionError):
+        ds.addPoints([[1.0,0.0]],[2.0])
+
+
+# user-024
+def test_job():
+    """A job runs like run, reports every step, and can be awaited or
+    cancelled."""
+    ds=clustering.Dataset(3,make_blobs(2000,3,8,29))
+    plain=clustering.ClusterGroup(ds,8,seed=14)
+    trace=plain.run(20)
+    group=clustering.ClusterGroup(ds,8,seed=14)
+    seen=[]
+    job=group.start(20,progress=lambda record: seen.append(record['inertia']))
+    assert len(job.wait(30))==len(trace)==len(seen)
+    assert job.isDone() and job.getStepCount()==len(trace)
+    assert numpy.array_equal(job.getCentroids(),plain._centroid_array())
+
+    async def wait(job):
+        return await job
+    job=clustering.ClusterGroup(ds,8,seed=14).start(20)
+    assert len(asyncio.run(wait(job)))==len(trace)
+
+    group=clustering.ClusterGroup(ds,8,seed=14)
+    ready=threading.Event()
+    def stop(record):
+        ready.wait()
+        job.cancel()
+    job=group.start(20,progress=stop)
+    ready.set()
+    assert len(job.wait(30))==1 and job.isCancelled()
+    assert numpy.array_equal(job.getCentroids(),group._centroid_array())
+
+
+def test_job_task_cancel():
+    """Cancelling the asyncio task awaiting a job cancels the job."""
+    ds=clustering.Dataset(3,make_blobs(2000,3,8,29))
+    job=clustering.ClusterGroup(ds,8,seed=14).start(1000,
+        progress=lambda record: time.sleep(0.01))
+
+    async def wait(job):
+        task=asyncio.ensure_future(job)
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(wait(job))
+    assert job.isCancelled()
+    assert len(job.wait(30))<1000
+
+
+# user-025
+@pytest.mark.parametrize('kind',[clustering.Dataset,clustering.SparseDataset])
+def test_membership_views(kind):
+    """The views of a cluster hold the points of its indices."""
+    rng=numpy.random.default_rng(30)
+    points=rng.standard_normal((400,6))*(rng.random((400,6))<0.5)
+    group=clustering.ClusterGroup(kind(6,points),4,seed=15)
+    group.run(5)
+    for cluster in group.getClusters():
+        indices=cluster.getIndices()
+        assert list(cluster.iterIndices())==indices
+        assert numpy.array_equal(cluster.getArray(),points[indices])
+        rows=[x.tolist() for x in cluster.iterPoints()]
+        assert rows==points[indices].tolist()==cluster.getContents()